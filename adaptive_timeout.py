@@ -0,0 +1,96 @@
+"""
+Adaptive Timeouts for Payment Gateway Proxy
+
+Per-route read timeout derived from the route's recent latencies: a high
+percentile (p99.9 by default) times a safety factor, clamped between a
+floor and the route's static timeout. Until enough samples are collected
+the static timeout is used. Only answered requests are sampled, so sporadic
+hangs do not drag the timeout up; after several timeouts in a row the route
+is assumed to have slowed down and the tracker falls back to the static
+timeout to learn the new latency.
+"""
+
+from collections import deque
+from typing import Any, Dict, Optional
+
+
+class AdaptiveTimeout:
+    """
+    Connect/read timeouts for one gateway route.
+    """
+
+    def __init__(self, config: Dict[str, Any], ceiling: float):
+        self.ceiling = float(ceiling)
+        self.adaptive = bool(config.get('adaptive', False))
+        self.percentile = float(config.get('percentile', 99.9))
+        self.factor = float(config.get('factor', 3.0))
+        self.floor = min(float(config.get('floor', 1.0)), self.ceiling)
+        self.min_samples = int(config.get('min_samples', 100))
+        self.recompute_every = int(config.get('recompute_every', 10))
+        self.reset_after = int(config.get('reset_after_timeouts', 3))
+
+        connect = config.get('connect')
+        self.connect: Optional[float] = min(float(connect), self.ceiling) if connect else None
+
+        self.samples: deque = deque(maxlen=int(config.get('window', 1000)))
+        self.current = self.ceiling
+        self.since_recompute = 0
+        self.consecutive_timeouts = 0
+
+        self.stats = {
+            'samples': 0,
+            'timeouts': 0,
+            'resets': 0
+        }
+
+    def read_timeout(self) -> float:
+        """Effective read timeout in seconds"""
+        if self.adaptive and len(self.samples) >= self.min_samples:
+            return self.current
+        return self.ceiling
+
+    def observe(self, latency: float, timed_out: bool = False):
+        """
+        Record a finished request
+
+        Args:
+            latency: Request duration in seconds
+            timed_out: Request hit the read timeout
+        """
+        if not self.adaptive:
+            return
+
+        if timed_out:
+            self.stats['timeouts'] += 1
+            self.consecutive_timeouts += 1
+            if self.consecutive_timeouts >= self.reset_after and self.samples:
+                # Gateway got slower than the learned timeout: relearn from ceiling
+                self.samples.clear()
+                self.current = self.ceiling
+                self.stats['resets'] += 1
+            return
+
+        self.consecutive_timeouts = 0
+        self.samples.append(latency)
+        self.stats['samples'] += 1
+        self.since_recompute += 1
+
+        if self.since_recompute >= self.recompute_every:
+            self._recompute()
+
+    def _recompute(self):
+        """Update current timeout from the latency window (nearest-rank percentile)"""
+        self.since_recompute = 0
+        ordered = sorted(self.samples)
+        rank = max(0, min(len(ordered) - 1, int(len(ordered) * self.percentile / 100)))
+        self.current = max(self.floor, min(self.ceiling, ordered[rank] * self.factor))
+
+    def report(self) -> Dict[str, Any]:
+        """Stats for /health"""
+        return {
+            **self.stats,
+            'adaptive': self.adaptive,
+            'read_timeout_s': round(self.read_timeout(), 3),
+            'connect_timeout_s': self.connect,
+            'ceiling_s': self.ceiling
+        }
@@ -0,0 +1,178 @@
+"""
+Traffic Capture for Payment Gateway Proxy
+
+Writes sampled request/response pairs (WS envelope, routed body, gateway
+response, timings) to rotating JSONL files. Records go through a bounded
+queue to a background writer; serialization, redaction and file I/O run in
+a worker thread, so capture never blocks the event loop. When the queue is
+full, records are dropped and counted.
+
+Capture files can be replayed with loadtest.py --capture.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import random
+import time
+from pathlib import Path
+from typing import Optional, Dict, Any, List
+
+
+# Card data never leaves the proxy unredacted
+DEFAULT_REDACT_FIELDS = (
+    'pan', 'card_number', 'cardnumber', 'card_no', 'cvv', 'cvc', 'cvv2',
+    'track1', 'track2', 'expiry', 'exp_date', 'expiration', 'pin', 'pin_block'
+)
+REDACTED = "***"
+
+
+def redact(value: Any, fields: frozenset) -> Any:
+    """Return a copy of value with sensitive fields masked (recursive)"""
+    if isinstance(value, dict):
+        return {
+            key: (REDACTED if key.lower() in fields else redact(item, fields))
+            for key, item in value.items()
+        }
+    if isinstance(value, list):
+        return [redact(item, fields) for item in value]
+    return value
+
+
+class TrafficCapture:
+    """
+    Sampled, redacted, non-blocking JSONL capture of proxied traffic.
+    """
+
+    def __init__(self, config: Dict[str, Any], logger: logging.Logger):
+        self.enabled = bool(config.get('enabled', False))
+        self.path = Path(config.get('path', 'capture/traffic.jsonl'))
+        self.sample_rate = float(config.get('sample_rate', 1.0))
+        self.max_bytes = int(config.get('max_bytes', 10 * 1024 * 1024))
+        self.backup_count = int(config.get('backup_count', 5))
+        self.batch_size = int(config.get('batch_size', 100))
+        self.redact_fields = frozenset(
+            field.lower() for field in config.get('redact_fields', DEFAULT_REDACT_FIELDS)
+        )
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=int(config.get('queue_size', 1000)))
+        self.logger = logger
+        self.writer_task: Optional[asyncio.Task] = None
+        self.pending_write: Optional[asyncio.Future] = None
+
+        self.stats = {
+            'captured': 0,
+            'dropped': 0,
+            'written': 0,
+            'write_errors': 0
+        }
+
+    def should_sample(self) -> bool:
+        """Decide whether the current message is captured"""
+        return self.enabled and (self.sample_rate >= 1.0 or random.random() < self.sample_rate)
+
+    def record(
+        self,
+        envelope: Any,
+        routed_body: Any,
+        response: Any,
+        operation_type: Optional[str],
+        timings: Dict[str, float]
+    ):
+        """
+        Queue one request/response pair for writing (never waits)
+
+        Objects are queued by reference and serialized later, so callers must
+        not mutate them after recording.
+        """
+        try:
+            self.queue.put_nowait({
+                'ts': time.time(),
+                'operation_type': operation_type,
+                'envelope': envelope,
+                'routed_body': routed_body,
+                'response': response,
+                'timings_ms': timings
+            })
+            self.stats['captured'] += 1
+        except asyncio.QueueFull:
+            self.stats['dropped'] += 1
+
+    def start(self):
+        """Start background writer (requires running event loop)"""
+        if self.enabled and self.writer_task is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self.writer_task = asyncio.create_task(self._writer())
+            self.logger.info(
+                f"🎥 Traffic capture enabled: {self.path} (sample rate {self.sample_rate})"
+            )
+
+    async def stop(self):
+        """Write out queued records and stop background writer"""
+        if self.writer_task is None:
+            return
+        self.writer_task.cancel()
+        try:
+            await self.writer_task
+        except asyncio.CancelledError:
+            pass
+        self.writer_task = None
+
+        # Let a batch already handed to the worker thread finish
+        if self.pending_write is not None:
+            await self.pending_write
+
+        # Flush whatever is still queued
+        batch = self._drain()
+        while batch:
+            await asyncio.to_thread(self._write_batch, batch)
+            batch = self._drain()
+
+    def _drain(self) -> List[Dict[str, Any]]:
+        """Take up to batch_size queued records without waiting"""
+        batch = []
+        while len(batch) < self.batch_size and not self.queue.empty():
+            batch.append(self.queue.get_nowait())
+        return batch
+
+    async def _writer(self):
+        """Move queued records to disk in batches"""
+        while True:
+            batch = [await self.queue.get()]
+            batch.extend(self._drain())
+            self.pending_write = asyncio.ensure_future(
+                asyncio.to_thread(self._write_batch, batch)
+            )
+            await asyncio.shield(self.pending_write)
+
+    def _write_batch(self, batch: List[Dict[str, Any]]):
+        """Redact, serialize and append records (runs in worker thread)"""
+        try:
+            lines = []
+            for record in batch:
+                record['envelope'] = redact(record['envelope'], self.redact_fields)
+                record['routed_body'] = redact(record['routed_body'], self.redact_fields)
+                record['response'] = redact(record['response'], self.redact_fields)
+                lines.append(json.dumps(record, ensure_ascii=False, default=str))
+            data = ("\n".join(lines) + "\n").encode('utf-8')
+
+            if self.path.exists() and self.path.stat().st_size + len(data) > self.max_bytes:
+                self._rotate()
+
+            with open(self.path, 'ab') as f:
+                f.write(data)
+            self.stats['written'] += len(batch)
+        except Exception as e:
+            self.stats['write_errors'] += 1
+            self.logger.error(f"❌ Capture write failed: {type(e).__name__}: {e}")
+
+    def _rotate(self):
+        """Shift traffic.jsonl -> traffic.jsonl.1 -> ... like RotatingFileHandler"""
+        for i in range(self.backup_count - 1, 0, -1):
+            source = Path(f"{self.path}.{i}")
+            if source.exists():
+                os.replace(source, f"{self.path}.{i + 1}")
+        if self.backup_count > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            self.path.unlink()
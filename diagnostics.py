@@ -0,0 +1,317 @@
+"""
+Diagnostics Endpoints for Payment Gateway Proxy
+
+Admin-only routes on the health server (localhost:9090) for finding hot-path
+regressions on a running proxy without restarting it:
+
+    GET  /debug/profile?seconds=10       sampled CPU profile of the event loop thread
+    POST /debug/profile/start            start profile, collect with .../stop
+    POST /debug/profile/stop
+    POST /debug/tracemalloc/start        start allocation tracing
+    GET  /debug/tracemalloc/snapshot     top allocations (?diff=1: vs previous)
+    POST /debug/tracemalloc/stop
+    GET  /debug/tasks                    all asyncio tasks with stacks
+    GET  /debug/loop-lag?seconds=5       event loop lag probe
+
+Routes are registered only when ADMIN_TOKEN is set and require it as
+"Authorization: Bearer <token>". Nothing runs until an endpoint is called:
+profiler, tracemalloc and lag probe are all off while idle. The profiler is a
+sampler: a background thread reads the loop thread's stack every few ms, so
+the profiled code runs at full speed (no per-call tracing hook).
+"""
+
+import asyncio
+import hmac
+import io
+import logging
+import os
+import random
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+from aiohttp import web
+
+
+MAX_SECONDS = 300
+SORT_KEYS = ('cumulative', 'own')
+
+
+class SamplingProfiler:
+    """
+    Samples one thread's Python stack from a background thread.
+    """
+
+    def __init__(self, thread_id: int, interval: float):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = 0
+        # (file, first line, function) -> samples on top of / anywhere in the stack
+        self.own: Counter = Counter()
+        self.cumulative: Counter = Counter()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="diagnostics-profiler", daemon=True)
+        self.switch_interval = sys.getswitchinterval()
+
+    def start(self):
+        # The sampler only runs when the loop thread yields the GIL; a short
+        # switch interval keeps CPU-bound stretches from hiding between samples
+        sys.setswitchinterval(min(self.switch_interval, self.interval / 5))
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+        sys.setswitchinterval(self.switch_interval)
+
+    def _run(self):
+        # Jitter keeps sampling from locking onto periodic work in the loop
+        while not self.stopped.wait(self.interval * random.uniform(0.5, 1.5)):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                return
+            self.samples += 1
+            seen = set()
+            top = True
+            while frame is not None:
+                code = frame.f_code
+                function = (code.co_filename, code.co_firstlineno, code.co_name)
+                if top:
+                    self.own[function] += 1
+                    top = False
+                # Recursion counts once per sample
+                if function not in seen:
+                    seen.add(function)
+                    self.cumulative[function] += 1
+                frame = frame.f_back
+
+    def report(self, sort: str, limit: int) -> str:
+        """Functions by share of samples, as text"""
+        counts = self.cumulative if sort == 'cumulative' else self.own
+        total = max(self.samples, 1)
+        out = io.StringIO()
+        out.write(f"{self.samples} samples every {self.interval * 1000:.1f}ms, sorted by {sort}\n")
+        out.write("(select = loop idle, waiting for I/O)\n\n")
+        out.write(f"{'own%':>7} {'cum%':>7}  function\n")
+        for function, _ in counts.most_common(limit):
+            filename, line, name = function
+            out.write(
+                f"{self.own[function] * 100 / total:7.1f} {self.cumulative[function] * 100 / total:7.1f}  "
+                f"{name} ({os.path.basename(filename)}:{line})\n"
+            )
+        return out.getvalue()
+
+
+class Diagnostics:
+    """
+    On-demand profiling and asyncio introspection handlers.
+    """
+
+    def __init__(self, token: str, logger: logging.Logger):
+        self.token = token
+        self.logger = logger
+        self.profiler: Optional[SamplingProfiler] = None
+        self.profile_started: Optional[float] = None
+        self.snapshot: Optional[tracemalloc.Snapshot] = None
+
+    def register(self, app: web.Application):
+        """Add /debug routes to the health server app"""
+        routes = [
+            ('GET', '/debug/profile', self.profile),
+            ('POST', '/debug/profile/start', self.profile_start),
+            ('POST', '/debug/profile/stop', self.profile_stop),
+            ('POST', '/debug/tracemalloc/start', self.tracemalloc_start),
+            ('GET', '/debug/tracemalloc/snapshot', self.tracemalloc_snapshot),
+            ('POST', '/debug/tracemalloc/stop', self.tracemalloc_stop),
+            ('GET', '/debug/tasks', self.tasks),
+            ('GET', '/debug/loop-lag', self.loop_lag),
+        ]
+        for method, path, handler in routes:
+            app.router.add_route(method, path, self._admin_only(handler))
+
+    def _admin_only(self, handler):
+        """Wrap handler with bearer token check"""
+        async def wrapper(request: web.Request) -> web.StreamResponse:
+            supplied = request.headers.get('Authorization', '')
+            if not hmac.compare_digest(supplied.encode(), f"Bearer {self.token}".encode()):
+                return web.json_response({'error': 'unauthorized'}, status=401)
+            return await handler(request)
+        return wrapper
+
+    @staticmethod
+    def _seconds(request: web.Request, default: float) -> float:
+        """Duration query parameter, bounded to MAX_SECONDS"""
+        try:
+            seconds = float(request.query.get('seconds', default))
+        except ValueError:
+            raise web.HTTPBadRequest(text="seconds must be a number")
+        return max(0.1, min(seconds, MAX_SECONDS))
+
+    @staticmethod
+    def _number(request: web.Request, name: str, default: float, low: float, high: float) -> float:
+        """Numeric query parameter bounded to [low, high], 400 if not a number"""
+        try:
+            value = float(request.query.get(name, default))
+        except ValueError:
+            raise web.HTTPBadRequest(text=f"{name} must be a number")
+        return max(low, min(value, high))
+
+    # CPU profile
+
+    def _start_profiler(self, request: web.Request) -> SamplingProfiler:
+        if self.profiler is not None:
+            raise web.HTTPConflict(text="Profile already running")
+        interval = self._number(request, 'interval_ms', 5, 1, 1000) / 1000
+        # Handlers run on the event loop thread - that is the one to sample
+        profiler = SamplingProfiler(threading.get_ident(), interval)
+        profiler.start()
+        self.profiler = profiler
+        self.profile_started = time.monotonic()
+        self.logger.warning(f"🔬 CPU profile started (sampling every {interval * 1000:.0f}ms)")
+        return profiler
+
+    def _report_options(self, request: web.Request) -> Tuple[str, int]:
+        """Profile report sort key and line limit"""
+        sort = request.query.get('sort', 'cumulative')
+        if sort not in SORT_KEYS:
+            raise web.HTTPBadRequest(text=f"sort must be one of: {', '.join(SORT_KEYS)}")
+        return sort, int(self._number(request, 'limit', 40, 1, 1000))
+
+    def _stop_profiler(self, request: web.Request) -> web.Response:
+        if self.profiler is None:
+            raise web.HTTPConflict(text="No profile running")
+        sort, limit = self._report_options(request)
+
+        profiler, self.profiler = self.profiler, None
+        profiler.stop()
+        duration = time.monotonic() - self.profile_started
+        self.logger.warning(f"🔬 CPU profile stopped after {duration:.1f}s")
+
+        text = profiler.report(sort, limit)
+        return web.Response(text=f"Profile of event loop thread, {duration:.1f}s\n{text}")
+
+    async def profile(self, request: web.Request) -> web.Response:
+        """Profile for ?seconds=N (default 10) and return the report text"""
+        seconds = self._seconds(request, 10)
+        self._report_options(request)
+        profiler = self._start_profiler(request)
+        try:
+            await asyncio.sleep(seconds)
+        except asyncio.CancelledError:
+            # Client went away: don't leave the profiler running, unless
+            # /debug/profile/stop already took it
+            if self.profiler is profiler:
+                self.profiler = None
+                profiler.stop()
+            raise
+        if self.profiler is not profiler:
+            raise web.HTTPConflict(text="Profile was stopped by /debug/profile/stop")
+        return self._stop_profiler(request)
+
+    async def profile_start(self, request: web.Request) -> web.Response:
+        self._start_profiler(request)
+        return web.json_response({'status': 'started'})
+
+    async def profile_stop(self, request: web.Request) -> web.Response:
+        return self._stop_profiler(request)
+
+    # tracemalloc
+
+    async def tracemalloc_start(self, request: web.Request) -> web.Response:
+        frames = int(self._number(request, 'frames', 10, 1, 100))
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+            self.snapshot = None
+            self.logger.warning(f"🔬 tracemalloc started ({frames} frames)")
+        return web.json_response({'status': 'tracing', 'frames': tracemalloc.get_traceback_limit()})
+
+    async def tracemalloc_snapshot(self, request: web.Request) -> web.Response:
+        """Top allocations by line; ?diff=1 compares with previous snapshot"""
+        if not tracemalloc.is_tracing():
+            raise web.HTTPConflict(text="tracemalloc not started")
+        limit = int(self._number(request, 'limit', 30, 1, 1000))
+        diff = request.query.get('diff') in ('1', 'true')
+
+        snapshot = tracemalloc.take_snapshot()
+        previous, self.snapshot = self.snapshot, snapshot
+        if diff and previous is None:
+            raise web.HTTPConflict(text="No previous snapshot to diff against")
+
+        noise = (
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        )
+
+        def top() -> List[Dict[str, Any]]:
+            filtered = snapshot.filter_traces(noise)
+            if diff:
+                stats = filtered.compare_to(previous.filter_traces(noise), 'lineno')
+                return [
+                    {'where': str(stat.traceback), 'size_kb': round(stat.size / 1024, 1),
+                     'size_diff_kb': round(stat.size_diff / 1024, 1), 'count_diff': stat.count_diff}
+                    for stat in stats[:limit]
+                ]
+            return [
+                {'where': str(stat.traceback), 'size_kb': round(stat.size / 1024, 1), 'count': stat.count}
+                for stat in filtered.statistics('lineno')[:limit]
+            ]
+
+        current, peak = tracemalloc.get_traced_memory()
+        return web.json_response({
+            'traced_kb': round(current / 1024, 1),
+            'peak_kb': round(peak / 1024, 1),
+            'diff': diff,
+            'top': await asyncio.to_thread(top)
+        })
+
+    async def tracemalloc_stop(self, request: web.Request) -> web.Response:
+        tracemalloc.stop()
+        self.snapshot = None
+        self.logger.warning("🔬 tracemalloc stopped")
+        return web.json_response({'status': 'stopped'})
+
+    # asyncio
+
+    async def tasks(self, request: web.Request) -> web.Response:
+        """All tasks of the event loop with their current stacks"""
+        depth = int(self._number(request, 'depth', 20, 1, 200))
+        current = asyncio.current_task()
+        result = []
+        for task in asyncio.all_tasks():
+            if task is current:
+                continue
+            stack = io.StringIO()
+            task.print_stack(limit=depth, file=stack)
+            coro = task.get_coro()
+            result.append({
+                'name': task.get_name(),
+                'coro': getattr(coro, '__qualname__', repr(coro)),
+                'stack': stack.getvalue().splitlines()[1:]
+            })
+        result.sort(key=lambda item: item['name'])
+        return web.json_response({'count': len(result), 'tasks': result})
+
+    async def loop_lag(self, request: web.Request) -> web.Response:
+        """Measure how late the loop wakes a sleeper (?seconds=5&interval_ms=10)"""
+        seconds = self._seconds(request, 5)
+        interval = self._number(request, 'interval_ms', 10, 1, 1000) / 1000
+
+        lags = []
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            started = time.monotonic()
+            await asyncio.sleep(interval)
+            lags.append(max(0.0, time.monotonic() - started - interval) * 1000)
+
+        lags.sort()
+        return web.json_response({
+            'samples': len(lags),
+            'interval_ms': interval * 1000,
+            'avg_ms': round(sum(lags) / len(lags), 3) if lags else 0.0,
+            'p50_ms': round(lags[len(lags) // 2], 3) if lags else 0.0,
+            'p99_ms': round(lags[min(len(lags) - 1, int(len(lags) * 0.99))], 3) if lags else 0.0,
+            'max_ms': round(lags[-1], 3) if lags else 0.0
+        })
@@ -0,0 +1,542 @@
+#!/usr/bin/env python3
+"""
+Load Test Harness for Payment Gateway Proxy
+
+Runs PaymentGatewayProxy in-process between a local stand-in WebSocket server
+and a mock HTTP gateway. The WS server replays captured JSONL traffic (or
+synthetic payment requests) at a configurable rate and concurrency; the mock
+gateway answers with configurable latency and error distributions.
+
+Reports throughput, p50/p99 end-to-end latency, memory and dropped/queued
+messages, so regressions in the hot path show up in numbers.
+
+Usage:
+    python loadtest.py --messages 2000 --rate 200 --concurrency 8
+    python loadtest.py --capture capture/traffic.jsonl --latency-ms 50 --error-rate 0.02
+    python loadtest.py --hop-benchmark --messages 5000   # gateway hop: TCP vs unix socket
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import multiprocessing
+import os
+import random
+import resource
+import shutil
+import socket
+import sys
+import tempfile
+import time
+from collections import deque
+from pathlib import Path
+from typing import List, Dict, Any, Optional
+
+import websockets
+import yaml
+from aiohttp import web
+
+from proxy import PaymentGatewayProxy
+
+
+def load_envelopes(path: Optional[str], count: int, operation_type: str) -> List[Dict[str, Any]]:
+    """
+    Load WS envelopes to replay
+
+    Capture records ({"envelope": {...}, ...}) and raw envelopes are both
+    accepted. Without a capture file, synthetic payment requests are generated.
+    """
+    if not path:
+        return [
+            {
+                'headers': {
+                    'header-kiosk-id': f"kiosk_{i % 10:03d}",
+                    'header-operation-type': operation_type
+                },
+                'body': {'kiosk_id': f"kiosk_{i % 10:03d}", 'order_id': i, 'sum': 150000}
+            }
+            for i in range(count)
+        ]
+
+    envelopes = []
+    with open(path, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            envelope = record.get('envelope', record)
+            if isinstance(envelope, dict):
+                envelopes.append(envelope)
+
+    if not envelopes:
+        raise ValueError(f"No envelopes found in {path}")
+
+    # Cycle through the capture to reach the requested message count
+    return [envelopes[i % len(envelopes)] for i in range(count or len(envelopes))]
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of a list"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+def max_rss_mb() -> float:
+    """Peak resident set size of this process in MB"""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KB, macOS reports bytes
+    return rss / (1024 * 1024) if sys.platform == 'darwin' else rss / 1024
+
+
+class MockGateway:
+    """
+    HTTP gateway stand-in with configurable latency and error distributions.
+    """
+
+    def __init__(
+        self,
+        latency_ms: float = 5.0,
+        jitter_ms: float = 0.0,
+        error_rate: float = 0.0,
+        hang_rate: float = 0.0,
+        hang_seconds: float = 60.0
+    ):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.hang_rate = hang_rate
+        self.hang_seconds = hang_seconds
+        self.requests = 0
+        self.runner: Optional[web.AppRunner] = None
+        self.port = 0
+
+    async def _handler(self, request):
+        self.requests += 1
+        body = await request.json()
+
+        roll = random.random()
+        if roll < self.hang_rate:
+            await asyncio.sleep(self.hang_seconds)
+        else:
+            delay = max(0.0, random.gauss(self.latency_ms, self.jitter_ms)) / 1000
+            if delay:
+                await asyncio.sleep(delay)
+
+        if roll < self.hang_rate + self.error_rate:
+            return web.json_response({'detail': 'mock gateway error'}, status=500)
+
+        return web.json_response({
+            'status': 'success',
+            'order_id': body.get('order_id') if isinstance(body, dict) else None,
+            'payment_id': self.requests
+        })
+
+    async def start(self, socket_path: Optional[str] = None) -> str:
+        app = web.Application()
+        app.router.add_post('/{tail:.*}', self._handler)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        if socket_path:
+            await web.UnixSite(self.runner, socket_path).start()
+            return f"unix://{socket_path}"
+        site = web.TCPSite(self.runner, '127.0.0.1', 0)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+        return f"http://127.0.0.1:{self.port}"
+
+    async def stop(self):
+        if self.runner:
+            await self.runner.cleanup()
+
+
+def serve_mock_gateway(socket_path: Optional[str], port: int):
+    """Run an instant-answer MockGateway forever (hop benchmark subprocess)"""
+    async def serve():
+        gateway = MockGateway(latency_ms=0)
+        app = web.Application()
+        app.router.add_post('/{tail:.*}', gateway._handler)
+        gateway.runner = web.AppRunner(app, access_log=None)
+        await gateway.runner.setup()
+        if socket_path:
+            await web.UnixSite(gateway.runner, socket_path).start()
+        else:
+            await web.TCPSite(gateway.runner, '127.0.0.1', port).start()
+        await asyncio.Event().wait()
+
+    asyncio.run(serve())
+
+
+class ReplayServer:
+    """
+    Stand-in for the cloud WS server: replays envelopes to the connected proxy
+    and measures end-to-end latency of the responses.
+
+    The proxy answers messages in the order it receives them, so responses are
+    matched to requests FIFO.
+    """
+
+    def __init__(self, envelopes: List[Dict[str, Any]], rate: float, concurrency: int, ack: bool = False):
+        self.ack = ack
+        self.messages = [json.dumps(envelope) for envelope in envelopes]
+        self.rate = rate
+        self.concurrency = concurrency
+        self.latencies: List[float] = []
+        self.sent = 0
+        self.received = 0
+        self.error_responses = 0
+        self.frames = 0
+        self.send_started = 0.0
+        self.send_finished = 0.0
+        self.last_response = 0.0
+        self.connected = asyncio.Event()
+        self.done = asyncio.Event()
+        self.server = None
+        self.port = 0
+
+    async def _handler(self, websocket, path=None):
+        self.connected.set()
+        in_flight = asyncio.Semaphore(self.concurrency)
+        pending = deque()
+
+        async def reader():
+            async for frame in websocket:
+                now = time.perf_counter()
+                # Coalesced frames carry a JSON array of responses
+                responses = json.loads(frame) if frame.startswith('[') else [frame]
+                if self.ack:
+                    # Unwrap {"seq": N, "data": ...} and ack cumulatively
+                    responses = [
+                        json.loads(response) if isinstance(response, str) else response
+                        for response in responses
+                    ]
+                    await websocket.send(json.dumps({
+                        'type': 'ack',
+                        'seq': max(response['seq'] for response in responses)
+                    }))
+                    responses = [response['data'] for response in responses]
+                for response in responses:
+                    if isinstance(response, dict):
+                        response = json.dumps(response)
+                    if '"status": "error"' in response:
+                        self.error_responses += 1
+                    if pending:
+                        self.latencies.append(now - pending.popleft())
+                        in_flight.release()
+                    self.received += 1
+                self.frames += 1
+                self.last_response = now
+                if self.received >= len(self.messages):
+                    self.done.set()
+
+        reader_task = asyncio.create_task(reader())
+        interval = 1 / self.rate if self.rate > 0 else 0
+        self.send_started = time.perf_counter()
+
+        try:
+            for i, message in enumerate(self.messages):
+                if interval:
+                    # Fixed schedule, so a slow proxy does not lower the offered rate
+                    delay = self.send_started + i * interval - time.perf_counter()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                await in_flight.acquire()
+                pending.append(time.perf_counter())
+                await websocket.send(message)
+                self.sent += 1
+            self.send_finished = time.perf_counter()
+            await self.done.wait()
+        finally:
+            reader_task.cancel()
+
+    async def start(self) -> str:
+        self.server = await websockets.serve(self._handler, '127.0.0.1', 0, max_size=None)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return f"ws://127.0.0.1:{self.port}/ws"
+
+    async def stop(self):
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+
+
+async def run_loadtest(args) -> Dict[str, Any]:
+    """Run one load test and return the report"""
+    # Proxy log, routing config, socket and pending file live here, removed after the run
+    with tempfile.TemporaryDirectory(prefix="loadtest_") as workdir:
+        return await _run_loadtest(args, workdir)
+
+
+async def _run_loadtest(args, workdir: str) -> Dict[str, Any]:
+    """Run one load test with its files in workdir"""
+    envelopes = load_envelopes(args.capture, args.messages, args.operation_type)
+
+    gateway = MockGateway(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+        hang_rate=args.hang_rate,
+        hang_seconds=args.route_timeout * 2
+    )
+    socket_path = str(Path(workdir) / "gateway.sock") if args.transport == 'unix' else None
+    gateway_url = await gateway.start(socket_path)
+
+    server = ReplayServer(envelopes, args.rate, args.concurrency, ack=args.ack)
+    ws_url = await server.start()
+
+    # Point every operation type in the traffic at the mock gateway
+    operation_types = {
+        envelope.get('headers', {}).get('header-operation-type')
+        or envelope.get('Header-Operation-Type')
+        for envelope in envelopes
+    }
+    routing = {
+        'routes': {
+            op: {'url': f"{gateway_url}/{op}", 'timeout': args.route_timeout}
+            for op in operation_types if op
+        },
+        'default': {'url': f"{gateway_url}/default", 'timeout': args.route_timeout},
+        'websocket': {
+            'coalesce': args.coalesce,
+            'ack': args.ack,
+            'compression': args.compression,
+            'compression_threshold': args.compression_threshold
+        },
+        # Responses left unacked at the end must not leak into the next run
+        'drain': {'pending_path': str(Path(workdir) / "pending_responses.jsonl")},
+        'timeouts': {'adaptive': args.adaptive_timeout, 'floor': 0.1, 'min_samples': 50},
+        # 'tcp-shared' = loopback through the general-purpose pool
+        'local_transport': {'loopback': args.transport != 'tcp-shared'}
+    }
+    routing_path = Path(workdir) / "routing_config.yaml"
+    routing_path.write_text(yaml.safe_dump(routing))
+
+    # Keep the proxy's daily log file out of the working tree
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        proxy = PaymentGatewayProxy(
+            ws_url=ws_url,
+            ws_token="loadtest",
+            routing_config_path=str(routing_path),
+            log_level=args.log_level
+        )
+    finally:
+        os.chdir(cwd)
+
+    rss_before = max_rss_mb()
+    proxy_task = asyncio.create_task(proxy.run())
+
+    try:
+        await asyncio.wait_for(server.connected.wait(), timeout=15)
+        try:
+            await asyncio.wait_for(server.done.wait(), timeout=args.max_duration)
+        except asyncio.TimeoutError:
+            pass
+    finally:
+        proxy.stop()
+        queued = proxy.offline_queue.qsize() + proxy.outbox.qsize()
+        await server.stop()
+        try:
+            await asyncio.wait_for(proxy_task, timeout=10)
+        except asyncio.TimeoutError:
+            proxy_task.cancel()
+        await gateway.stop()
+
+    elapsed = (server.last_response or time.perf_counter()) - server.send_started
+    latencies_ms = [latency * 1000 for latency in server.latencies]
+
+    return {
+        'transport': args.transport,
+        'messages': len(envelopes),
+        'sent': server.sent,
+        'responses': server.received,
+        'frames': server.frames,
+        'outbound_queue_ms': {
+            'avg': proxy.outbound_stats['queue_time_ms_avg'],
+            'max': proxy.outbound_stats['queue_time_ms_max']
+        },
+        'dropped': server.sent - server.received,
+        'queued': queued,
+        'error_responses': server.error_responses,
+        'proxy_errors': proxy.stats['errors'],
+        'gateway_requests': gateway.requests,
+        'duration_s': round(elapsed, 3),
+        'offered_rate': args.rate or None,
+        'throughput_msg_s': round(server.received / elapsed, 1) if elapsed > 0 else 0.0,
+        'latency_ms': {
+            'p50': round(percentile(latencies_ms, 50), 3),
+            'p99': round(percentile(latencies_ms, 99), 3),
+            'max': round(max(latencies_ms, default=0.0), 3)
+        },
+        'wire': proxy._wire_report(),
+        'timeouts': {
+            url: timeouts.report() for url, timeouts in proxy.route_timeouts.items() if timeouts.adaptive
+        } or None,
+        'max_rss_mb': round(max_rss_mb(), 1),
+        'rss_growth_mb': round(max_rss_mb() - rss_before, 1)
+    }
+
+
+async def run_hop_benchmark(args) -> Dict[str, Any]:
+    """
+    Time the proxy -> gateway HTTP hop alone (no WS) for each transport:
+    loopback TCP via the shared pool, loopback TCP via the local pool, unix socket
+
+    The gateway runs in its own process, as the real one does.
+    """
+    body = load_envelopes(None, 1, args.operation_type)[0]['body']
+    results = {}
+
+    for transport in ('tcp-shared', 'tcp', 'unix'):
+        workdir = tempfile.mkdtemp(prefix="loadtest_")
+        socket_path = str(Path(workdir) / "gateway.sock") if transport == 'unix' else None
+        with socket.socket() as probe:
+            probe.bind(('127.0.0.1', 0))
+            port = probe.getsockname()[1]
+        gateway = multiprocessing.Process(target=serve_mock_gateway, args=(socket_path, port), daemon=True)
+        gateway.start()
+        if socket_path:
+            gateway_url = f"unix://{socket_path}/{args.operation_type}"
+        else:
+            gateway_url = f"http://127.0.0.1:{port}/{args.operation_type}"
+
+        routing_path = Path(workdir) / "routing_config.yaml"
+        routing_path.write_text(yaml.safe_dump({
+            'routes': {args.operation_type: {'url': gateway_url, 'timeout': args.route_timeout}},
+            'local_transport': {'loopback': transport != 'tcp-shared'}
+        }))
+        cwd = os.getcwd()
+        os.chdir(workdir)
+        try:
+            proxy = PaymentGatewayProxy(
+                ws_url="ws://unused",
+                ws_token="loadtest",
+                routing_config_path=str(routing_path),
+                log_level=args.log_level
+            )
+        finally:
+            os.chdir(cwd)
+
+        try:
+            # Wait for gateway to listen, then warm up pool and code paths
+            for _ in range(100):
+                if 'error' not in await proxy.send_to_gateway(body, gateway_url, args.route_timeout):
+                    break
+                await asyncio.sleep(0.05)
+            for _ in range(100):
+                await proxy.send_to_gateway(body, gateway_url, args.route_timeout)
+            proxy.stats['errors'] = 0
+
+            latencies_us = []
+            for _ in range(args.messages):
+                started = time.perf_counter()
+                await proxy.send_to_gateway(body, gateway_url, args.route_timeout)
+                latencies_us.append((time.perf_counter() - started) * 1e6)
+        finally:
+            for session in [proxy.http_session, *proxy.local_sessions.values()]:
+                if session is not None:
+                    await session.close()
+            gateway.terminate()
+            gateway.join()
+            shutil.rmtree(workdir, ignore_errors=True)
+
+        results[transport] = {
+            'requests': len(latencies_us),
+            'errors': proxy.stats['errors'],
+            'mean_us': round(sum(latencies_us) / len(latencies_us), 1) if latencies_us else 0.0,
+            'p50_us': round(percentile(latencies_us, 50), 1),
+            'p99_us': round(percentile(latencies_us, 99), 1)
+        }
+
+    return results
+
+
+def print_report(report: Dict[str, Any]):
+    """Print human-readable report"""
+    latency = report['latency_ms']
+    print("=" * 60)
+    print("📊 Load Test Results:")
+    print(f"   Gateway transport: {report['transport']}")
+    print(f"   Messages sent/answered: {report['sent']}/{report['responses']}")
+    print(f"   Frames received: {report['frames']}")
+    print(f"   Dropped: {report['dropped']}  Queued: {report['queued']}")
+    print(f"   Error responses: {report['error_responses']}  Proxy errors: {report['proxy_errors']}")
+    print(f"   Duration: {report['duration_s']}s")
+    print(f"   Throughput: {report['throughput_msg_s']} msg/s")
+    print(f"   Latency p50/p99/max: {latency['p50']} / {latency['p99']} / {latency['max']} ms")
+    outbound = report['outbound_queue_ms']
+    print(f"   Outbound queue time avg/max: {outbound['avg']} / {outbound['max']} ms")
+    wire = report['wire']
+    print(
+        f"   WS bytes out/in: {wire['bytes_out']}/{wire['bytes_in']} "
+        f"(wire {wire['bytes_out_wire']}/{wire['bytes_in_wire']}, saved {wire['savings_pct']}%)"
+    )
+    for url, timeouts in (report['timeouts'] or {}).items():
+        print(
+            f"   Timeout {url}: read {timeouts['read_timeout_s']}s "
+            f"(ceiling {timeouts['ceiling_s']}s, timeouts {timeouts['timeouts']})"
+        )
+    print(f"   Max RSS: {report['max_rss_mb']} MB (+{report['rss_growth_mb']} MB during run)")
+    print("=" * 60)
+
+
+def main():
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description="Load test PaymentGatewayProxy")
+    parser.add_argument('--capture', help="JSONL capture to replay (default: synthetic)")
+    parser.add_argument('--messages', type=int, default=1000, help="Messages to send (0 = whole capture)")
+    parser.add_argument('--rate', type=float, default=0, help="Messages per second (0 = unlimited)")
+    parser.add_argument('--concurrency', type=int, default=1, help="Max unanswered messages in flight")
+    parser.add_argument('--operation-type', default='payment', help="Operation type for synthetic traffic")
+    parser.add_argument('--latency-ms', type=float, default=5.0, help="Mock gateway mean latency")
+    parser.add_argument('--jitter-ms', type=float, default=0.0, help="Mock gateway latency std deviation")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Share of HTTP 500 responses")
+    parser.add_argument('--hang-rate', type=float, default=0.0, help="Share of requests that time out")
+    parser.add_argument('--route-timeout', type=float, default=5.0, help="Route timeout in seconds")
+    parser.add_argument(
+        '--transport', default='tcp', choices=['tcp', 'tcp-shared', 'unix'],
+        help="Gateway hop: loopback TCP (local pool), loopback TCP (shared pool) or unix socket"
+    )
+    parser.add_argument('--coalesce', action='store_true', help="Let proxy coalesce responses into one frame")
+    parser.add_argument('--ack', action='store_true', help="Use acknowledged delivery protocol")
+    parser.add_argument('--compression', default='on', choices=['on', 'adaptive', 'off'])
+    parser.add_argument('--compression-threshold', type=int, default=1024, help="Adaptive mode threshold, bytes")
+    parser.add_argument('--adaptive-timeout', action='store_true', help="Derive read timeouts from gateway latency")
+    parser.add_argument('--hop-benchmark', action='store_true', help="Benchmark gateway hop only, per transport")
+    parser.add_argument('--max-duration', type=float, default=300.0, help="Stop after N seconds")
+    parser.add_argument('--log-level', default='CRITICAL', help="Proxy log level")
+    parser.add_argument('--json', action='store_true', help="Print report as JSON")
+    args = parser.parse_args()
+
+    if args.hop_benchmark:
+        results = asyncio.run(run_hop_benchmark(args))
+        if args.json:
+            print(json.dumps(results, indent=2))
+        else:
+            print("📊 Gateway hop (sequential requests, mock answers immediately):")
+            for transport, result in results.items():
+                print(
+                    f"   {transport:<10} mean {result['mean_us']} µs  p50 {result['p50_us']} µs  "
+                    f"p99 {result['p99_us']} µs  errors {result['errors']}"
+                )
+        return
+
+    try:
+        report = asyncio.run(run_loadtest(args))
+    except ValueError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+
+if __name__ == '__main__':
+    main()
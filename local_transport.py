@@ -0,0 +1,68 @@
+"""
+Local Gateway Transport for Payment Gateway Proxy
+
+HTTP transport profile for gateways on the same machine: unix domain sockets
+(route URL unix:///run/gateway.sock/api/v1/...) and loopback TCP. Local
+upstreams get their own connection pool with long-lived keep-alive
+connections, so the payment hop does not pay for connection setup or share
+pool slots with remote gateways. aiohttp never pipelines, so each pooled
+connection carries one request at a time.
+"""
+
+import ipaddress
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+import aiohttp
+
+
+UNIX_SCHEME = 'unix://'
+SOCKET_SUFFIX = '.sock'
+
+
+def split_unix_url(url: str) -> Tuple[str, str]:
+    """
+    Split unix:// route URL into socket path and HTTP path
+
+    The socket path ends at the first path component ending in '.sock':
+    unix:///run/gateway.sock/api/v1/pay -> ('/run/gateway.sock', '/api/v1/pay')
+    """
+    path = url[len(UNIX_SCHEME):]
+    marker = path.find(SOCKET_SUFFIX)
+    while marker != -1:
+        end = marker + len(SOCKET_SUFFIX)
+        if end == len(path) or path[end] == '/':
+            return path[:end], path[end:] or '/'
+        marker = path.find(SOCKET_SUFFIX, end)
+    raise ValueError(f"unix:// URL must name a *.sock file: {url}")
+
+
+def is_local_url(url: str) -> bool:
+    """True for unix:// URLs and loopback HTTP hosts"""
+    if url.startswith(UNIX_SCHEME):
+        return True
+    host = urlsplit(url).hostname or ''
+    if host == 'localhost':
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def local_connector(config: Dict[str, Any], socket_path: Optional[str] = None) -> aiohttp.BaseConnector:
+    """
+    Connector for a local upstream ('local_transport' section)
+
+    Args:
+        config: keepalive_timeout (seconds idle connections are kept), limit
+        socket_path: Unix socket path, or None for loopback TCP
+    """
+    options = {
+        'limit': int(config.get('limit', 10)),
+        'keepalive_timeout': float(config.get('keepalive_timeout', 300)),
+    }
+    if socket_path:
+        return aiohttp.UnixConnector(path=socket_path, **options)
+    # No DNS for loopback; pool is per host:port
+    return aiohttp.TCPConnector(limit_per_host=options['limit'], use_dns_cache=False, **options)
@@ -0,0 +1,451 @@
+#!/usr/bin/env python3
+"""
+Log Index for Payment Gateway Proxy
+
+Builds a compact SQLite index over rotated proxy logs (proxy_YYYYMMDD.log,
+gateway_proxy_*.log) so incidents can be searched without rescanning every file.
+Only lines that start handling a message (received marker) or carry an error
+code are indexed; each stores timestamp, level, operation type, kiosk, error
+code and byte offset into the source file. Updates are incremental: only bytes
+appended since the last run are parsed, and files that no longer exist are
+dropped from the index.
+
+Usage:
+    python log_index.py update
+    python log_index.py search --kiosk kiosk_001 --error timeout --since yesterday
+    python log_index.py stats --errors --by hour,route
+"""
+
+import argparse
+import re
+import sqlite3
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Optional, Dict, Any, List, Tuple
+
+
+DEFAULT_INDEX_PATH = ".log_index.sqlite"
+# Bump when indexed line selection or schema changes: old index is rebuilt
+INDEX_VERSION = 2
+# Includes RotatingFileHandler backups (proxy_YYYYMMDD.log.1, ...)
+DEFAULT_LOG_PATTERNS = ("proxy_*.log", "proxy_*.log.*", "gateway_proxy_*.log", "gateway_proxy_*.log.*")
+
+# "2025-10-03 18:55:49,018 - ERROR - msg" or "... - __main__ - ERROR - msg"
+LINE_RE = re.compile(
+    r'^(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}),\d{3} - '
+    r'(?:\S+ - )?(DEBUG|INFO|WARNING|ERROR|CRITICAL) - (.*)$'
+)
+
+# Message start markers, newest log format first
+RECEIVED_RE = re.compile(r'📥 Received: (\S+) from kiosk (\S+)')
+RECEIVED_CLOUD_RE = re.compile(r'📥 Received from cloud: (\S+)')
+HEADER_OP_RE = re.compile(r'Header-Operation-Type: (\S+)')
+HEADER_KIOSK_RE = re.compile(r'Header-Kiosk-Id: (\S+)')
+PAYLOAD_KIOSK_RE = re.compile(r'"kiosk_id": "([^"]+)"')
+# Keepalive/control messages from the cloud, not payment operations
+CONTROL_OPS = ('ping', 'pong', 'connection_status')
+CONNECTION_RE = re.compile(r'Connecting to|Connection (?:lost|failed|timeout)|connection closed|starting\.\.\.')
+
+# Message fragment -> error code (same codes the proxy returns to the cloud)
+ERROR_PATTERNS = (
+    ('Gateway timeout', 'timeout'),
+    ('Gateway connect timeout', 'connect_timeout'),
+    ('Cannot connect to gateway', 'connection_refused'),
+    ('ateway error: HTTP', 'http_error'),
+    ('Gateway error:', 'other'),
+    ('Route not found', 'route_not_found'),
+    ('Missing Header-Operation-Type', 'missing_header'),
+    ('Invalid JSON', 'invalid_json'),
+    ('Error handling message', 'processing_error'),
+    ('Connection timeout', 'ws_timeout'),
+    ('Connection failed:', 'ws_connect_failed'),
+    ('Failed to connect to cloud', 'ws_connect_failed'),
+    ('WebSocket connection closed', 'ws_closed'),
+    ('Failed to send', 'send_failed'),
+    ('Queue full', 'queue_full'),
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    inode INTEGER NOT NULL,
+    offset INTEGER NOT NULL DEFAULT 0,
+    op TEXT,
+    kiosk TEXT
+);
+CREATE TABLE IF NOT EXISTS events (
+    file_id INTEGER NOT NULL,
+    ts TEXT NOT NULL,
+    level TEXT NOT NULL,
+    op TEXT,
+    kiosk TEXT,
+    error TEXT,
+    offset INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS events_ts ON events (ts);
+CREATE INDEX IF NOT EXISTS events_kiosk_ts ON events (kiosk, ts);
+CREATE INDEX IF NOT EXISTS events_error_ts ON events (error, ts);
+"""
+
+
+def classify_error(message: str) -> Optional[str]:
+    """Map a log message to an error code, or None"""
+    for fragment, code in ERROR_PATTERNS:
+        if fragment in message:
+            return code
+    return None
+
+
+def parse_time(value: Optional[str]) -> Optional[str]:
+    """
+    Parse a time filter into index timestamp format
+
+    Accepts 'today', 'yesterday', relative '6h' / '2d', a date 'YYYY-MM-DD'
+    or a datetime 'YYYY-MM-DD HH:MM[:SS]'.
+    """
+    if not value:
+        return None
+
+    now = datetime.now()
+    midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+
+    if value == 'today':
+        moment = midnight
+    elif value == 'yesterday':
+        moment = midnight - timedelta(days=1)
+    elif re.fullmatch(r'\d+[hd]', value):
+        amount = int(value[:-1])
+        unit = 'hours' if value[-1] == 'h' else 'days'
+        moment = now - timedelta(**{unit: amount})
+    else:
+        for fmt in ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%d'):
+            try:
+                moment = datetime.strptime(value, fmt)
+                break
+            except ValueError:
+                continue
+        else:
+            raise ValueError(f"Unrecognized time: {value}")
+
+    return moment.strftime('%Y-%m-%d %H:%M:%S')
+
+
+class LogIndex:
+    """
+    Incremental on-disk index over proxy log files.
+    """
+
+    def __init__(self, index_path: str = DEFAULT_INDEX_PATH, log_dir: str = "."):
+        self.index_path = index_path
+        self.log_dir = Path(log_dir)
+        # monitor.py uses the index from worker threads, one at a time
+        self.db = sqlite3.connect(index_path, check_same_thread=False)
+        if self.db.execute("PRAGMA user_version").fetchone()[0] != INDEX_VERSION:
+            self.db.executescript("DROP TABLE IF EXISTS events; DROP TABLE IF EXISTS files;")
+            self.db.execute(f"PRAGMA user_version = {INDEX_VERSION}")
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def _log_files(self) -> List[Path]:
+        """All log files matching known proxy log patterns"""
+        files = set()
+        for pattern in DEFAULT_LOG_PATTERNS:
+            files.update(self.log_dir.glob(pattern))
+        return sorted(files)
+
+    def update(self) -> Dict[str, int]:
+        """
+        Index new bytes appended to every log file since the last update
+
+        Returns:
+            Dict with number of files scanned, events added and files removed
+        """
+        added = 0
+        files = self._log_files()
+        for path in files:
+            added += self._update_file(path)
+
+        # After the scan, so rotated (renamed) files are matched by inode first
+        removed = self._prune_missing()
+
+        self.db.commit()
+        return {'files': len(files), 'events': added, 'removed': removed}
+
+    def _prune_missing(self) -> int:
+        """Drop files (and their events) deleted since they were indexed"""
+        missing = [
+            (file_id,) for file_id, path in self.db.execute("SELECT id, path FROM files")
+            if not Path(path).exists()
+        ]
+        self.db.executemany("DELETE FROM events WHERE file_id = ?", missing)
+        self.db.executemany("DELETE FROM files WHERE id = ?", missing)
+        return len(missing)
+
+    def _update_file(self, path: Path) -> int:
+        """Index one file from its last indexed offset"""
+        stat = path.stat()
+        key = str(path)
+
+        row = self.db.execute(
+            "SELECT id, inode, offset, op, kiosk FROM files WHERE path = ?", (key,)
+        ).fetchone()
+
+        if row is None:
+            # Rotated file (renamed by RotatingFileHandler) keeps its inode
+            moved = self.db.execute(
+                "SELECT id, path FROM files WHERE inode = ?", (stat.st_ino,)
+            ).fetchall()
+            for file_id, old_path in moved:
+                if not Path(old_path).exists():
+                    self.db.execute("UPDATE files SET path = ? WHERE id = ?", (key, file_id))
+                    row = self.db.execute(
+                        "SELECT id, inode, offset, op, kiosk FROM files WHERE id = ?",
+                        (file_id,)
+                    ).fetchone()
+                    break
+
+        if row is None:
+            cursor = self.db.execute(
+                "INSERT INTO files (path, inode) VALUES (?, ?)", (key, stat.st_ino)
+            )
+            row = (cursor.lastrowid, stat.st_ino, 0, None, None)
+
+        file_id, inode, offset, op, kiosk = row
+
+        # Truncated or replaced file - reindex from scratch
+        if inode != stat.st_ino or stat.st_size < offset:
+            self.db.execute("DELETE FROM events WHERE file_id = ?", (file_id,))
+            offset, op, kiosk = 0, None, None
+
+        if stat.st_size == offset:
+            return 0
+
+        events = []
+        # Row for the message start line, completed with op/kiosk from the
+        # header and payload lines that follow it
+        start = None
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            for raw in f:
+                # Stop at a partially written last line, pick it up next time
+                if not raw.endswith(b'\n'):
+                    break
+
+                line_offset = offset
+                offset += len(raw)
+
+                match = LINE_RE.match(raw.decode('utf-8', errors='replace').rstrip('\n'))
+                if not match:
+                    continue
+
+                ts, level, message = match.groups()
+
+                # Track which message is being handled; the proxy processes
+                # messages sequentially, so following lines belong to it
+                received = RECEIVED_RE.search(message)
+                starts_message = received is not None or '📥' in message
+                if starts_message and start:
+                    events.append(tuple(start))
+                    start = None
+                if received:
+                    op, kiosk = received.groups()
+                    op = None if op in ('unknown', 'None') else op
+                    kiosk = None if kiosk in ('unknown', 'None') else kiosk
+                elif starts_message:
+                    received = RECEIVED_CLOUD_RE.search(message)
+                    op, kiosk = (received.group(1) if received else None), None
+                else:
+                    header_op = HEADER_OP_RE.search(message)
+                    header_kiosk = HEADER_KIOSK_RE.search(message) or PAYLOAD_KIOSK_RE.search(message)
+                    if header_op and header_op.group(1) != 'None':
+                        op = header_op.group(1)
+                    if header_kiosk and header_kiosk.group(1) != 'None' and not kiosk:
+                        kiosk = header_kiosk.group(1)
+
+                # Only message starts and errors get an index row
+                if starts_message and op not in CONTROL_OPS:
+                    start = [file_id, ts, level, op, kiosk, None, line_offset]
+                elif start:
+                    start[3:5] = op, kiosk
+
+                error = classify_error(message)
+                if error:
+                    events.append((file_id, ts, level, op, kiosk, error, line_offset))
+
+                # Response sent or connection-level event - message handling is over
+                if '📤' in message or CONNECTION_RE.search(message):
+                    op, kiosk = None, None
+                    if start:
+                        events.append(tuple(start))
+                        start = None
+
+        if start:
+            events.append(tuple(start))
+
+        self.db.executemany(
+            "INSERT INTO events (file_id, ts, level, op, kiosk, error, offset) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            events
+        )
+        self.db.execute(
+            "UPDATE files SET inode = ?, offset = ?, op = ?, kiosk = ? WHERE id = ?",
+            (stat.st_ino, offset, op, kiosk, file_id)
+        )
+        return len(events)
+
+    def _where(
+        self,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+        kiosk: Optional[str] = None,
+        op: Optional[str] = None,
+        error: Optional[str] = None,
+        level: Optional[str] = None,
+        errors_only: bool = False
+    ) -> Tuple[str, List[Any]]:
+        """Build WHERE clause for event filters"""
+        clauses, params = [], []
+        if since:
+            clauses.append("e.ts >= ?")
+            params.append(since)
+        if until:
+            clauses.append("e.ts < ?")
+            params.append(until)
+        if kiosk:
+            clauses.append("e.kiosk = ?")
+            params.append(kiosk)
+        if op:
+            clauses.append("e.op = ?")
+            params.append(op)
+        if error:
+            clauses.append("e.error = ?")
+            params.append(error)
+        if level:
+            clauses.append("e.level = ?")
+            params.append(level.upper())
+        if errors_only:
+            clauses.append("e.error IS NOT NULL")
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        return where, params
+
+    def search(self, limit: int = 200, **filters) -> List[Dict[str, Any]]:
+        """
+        Find indexed events matching filters, oldest first
+
+        Returns:
+            List of event dicts with source path and byte offset
+        """
+        where, params = self._where(**filters)
+        rows = self.db.execute(
+            f"SELECT f.path, e.ts, e.level, e.op, e.kiosk, e.error, e.offset "
+            f"FROM events e JOIN files f ON f.id = e.file_id {where} "
+            f"ORDER BY e.ts, e.offset LIMIT ?",
+            params + [limit]
+        ).fetchall()
+        keys = ('path', 'ts', 'level', 'op', 'kiosk', 'error', 'offset')
+        return [dict(zip(keys, row)) for row in rows]
+
+    def stats(self, by: List[str], **filters) -> List[Tuple]:
+        """
+        Count events grouped by any of: hour, day, route, kiosk, error, level
+
+        Returns:
+            List of (group values..., count) tuples
+        """
+        columns = {
+            'hour': "substr(ts, 1, 13) || ':00'",
+            'day': "substr(ts, 1, 10)",
+            'route': "op",
+            'kiosk': "kiosk",
+            'error': "error",
+            'level': "level",
+        }
+        unknown = [name for name in by if name not in columns]
+        if unknown:
+            raise ValueError(f"Unknown group: {', '.join(unknown)}")
+
+        select = ", ".join(columns[name] for name in by) or "'all'"
+        group = f"GROUP BY {select}" if by else ""
+        where, params = self._where(**filters)
+        return self.db.execute(
+            f"SELECT {select}, COUNT(*) FROM events e {where} {group} ORDER BY 1",
+            params
+        ).fetchall()
+
+    @staticmethod
+    def read_line(path: str, offset: int) -> Optional[str]:
+        """Read the original log line at byte offset, None if the file is gone"""
+        try:
+            with open(path, 'rb') as f:
+                f.seek(offset)
+                return f.readline().decode('utf-8', errors='replace').rstrip('\n')
+        except FileNotFoundError:
+            return None
+
+
+def main():
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description="Index and search proxy logs")
+    parser.add_argument('--index', default=DEFAULT_INDEX_PATH, help="Index file path")
+    parser.add_argument('--log-dir', default=".", help="Directory with proxy logs")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    commands.add_parser('update', help="Index new log lines")
+
+    for name in ('search', 'stats'):
+        command = commands.add_parser(name)
+        command.add_argument('--since', help="today, yesterday, 6h, 2d or YYYY-MM-DD[ HH:MM]")
+        command.add_argument('--until', help="Same formats as --since")
+        command.add_argument('--kiosk')
+        command.add_argument('--op', help="Operation type (route)")
+        command.add_argument('--error', help="Error code, e.g. timeout")
+        command.add_argument('--level', help="Log level, e.g. ERROR")
+        command.add_argument('--errors', action='store_true', help="Only lines with an error code")
+
+    commands.choices['search'].add_argument('--limit', type=int, default=200)
+    commands.choices['stats'].add_argument(
+        '--by', default='hour', help="Comma-separated: hour, day, route, kiosk, error, level"
+    )
+
+    args = parser.parse_args()
+
+    index = LogIndex(args.index, args.log_dir)
+    try:
+        result = index.update()
+        if args.command == 'update':
+            print(
+                f"✅ Indexed {result['events']} new lines from {result['files']} files"
+                f" ({result['removed']} removed)"
+            )
+            return
+
+        filters = {
+            'since': parse_time(args.since),
+            'until': parse_time(args.until),
+            'kiosk': args.kiosk,
+            'op': args.op,
+            'error': args.error,
+            'level': args.level,
+            'errors_only': args.errors,
+        }
+
+        if args.command == 'search':
+            for event in index.search(limit=args.limit, **filters):
+                line = index.read_line(event['path'], event['offset'])
+                print(f"{event['path']}: {'(file removed)' if line is None else line}")
+        else:
+            for row in index.stats([name for name in args.by.split(',') if name], **filters):
+                print("\t".join('-' if value is None else str(value) for value in row))
+    except (ValueError, OSError, sqlite3.Error) as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    finally:
+        index.close()
+
+
+if __name__ == '__main__':
+    main()
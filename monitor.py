@@ -10,6 +10,7 @@ import yaml
 import re
 import subprocess
 import sys
+import threading
 from datetime import datetime
 from pathlib import Path
 from typing import Optional
@@ -20,9 +21,11 @@ from textual.widgets import (
     Header, Footer, Static, Button, Label, Input,
     TextArea, TabbedContent, TabPane, DataTable, RichLog
 )
-from textual import on
+from textual import on, work
 from dotenv import load_dotenv, set_key
 
+from log_index import LogIndex, parse_time
+
 load_dotenv()
 
 
@@ -132,12 +135,18 @@ class ProxyMonitor(App):
     }
     """
 
+    # Proxy drains in-flight payments on SIGTERM (drain.timeout in
+    # routing_config.yaml); wait that long plus a margin before SIGKILL
+    DEFAULT_DRAIN_TIMEOUT = 30
+    DRAIN_WAIT_MARGIN = 5
+
     BINDINGS = [
         ("q", "quit", "Quit"),
         ("1", "switch_tab('control')", "Control"),
         ("2", "switch_tab('logs')", "Logs"),
         ("3", "switch_tab('settings')", "Settings"),
         ("4", "switch_tab('routes')", "Routes"),
+        ("5", "switch_tab('history')", "History"),
     ]
 
     def __init__(self):
@@ -146,6 +155,10 @@ class ProxyMonitor(App):
         self.env_file = Path(".env")
         self.routing_config_file = Path("routing_config.yaml")
         self.proxy_process: Optional[subprocess.Popen] = None
+        self.draining_process: Optional[subprocess.Popen] = None
+        self.log_index: Optional[LogIndex] = None
+        # Index is updated and queried from worker threads, one at a time
+        self.log_index_lock = threading.Lock()
 
     def _get_latest_log_file(self) -> Optional[Path]:
         """Find the latest proxy log file"""
@@ -232,6 +245,21 @@ class ProxyMonitor(App):
                     yield Button("SAVE ROUTES", id="save-routes-btn")
                     yield Static("", id="routes-status", classes="status-msg")
 
+            # History Tab (indexed search over all rotated logs)
+            with TabPane("History", id="history"):
+                with Vertical():
+                    with Horizontal():
+                        yield Input(placeholder="since: yesterday / 6h / 2025-10-03", id="history-since")
+                        yield Input(placeholder="until", id="history-until")
+                        yield Input(placeholder="kiosk", id="history-kiosk")
+                        yield Input(placeholder="route", id="history-op")
+                        yield Input(placeholder="error: timeout", id="history-error")
+                    with Horizontal():
+                        yield Button("SEARCH", id="history-search-btn")
+                        yield Button("ERRORS / HOUR", id="history-stats-btn")
+                    yield Static("", id="history-status", classes="status-msg")
+                    yield DataTable(id="history-table")
+
         yield Footer()
 
     def _load_routing_config_text(self) -> str:
@@ -248,12 +276,16 @@ class ProxyMonitor(App):
         self.set_interval(3, self.update_stats)
         self.set_interval(2, self.update_logs)
         self.set_interval(1, self.check_proxy_status)
+        self.set_interval(30, self.update_log_index)
+        self.update_log_index()
         self.load_routes_table()
 
     def check_proxy_status(self) -> None:
         """Check if proxy process is running"""
         status_widget = self.query_one("#status-text", Static)
-        if self.proxy_process and self.proxy_process.poll() is None:
+        if self.draining_process and self.draining_process.poll() is None:
+            status_widget.update("⏳ DRAINING")
+        elif self.proxy_process and self.proxy_process.poll() is None:
             status_widget.update("▶ RUNNING")
         else:
             status_widget.update("■ STOPPED")
@@ -263,6 +295,8 @@ class ProxyMonitor(App):
         """Start the proxy process"""
         if self.proxy_process and self.proxy_process.poll() is None:
             return
+        if self.draining_process and self.draining_process.poll() is None:
+            return
 
         try:
             self.proxy_process = subprocess.Popen(
@@ -273,22 +307,51 @@ class ProxyMonitor(App):
         except Exception as e:
             self.query_one("#status-text", Static).update(f"ERROR: {e}")
 
+    def _drain_wait_seconds(self) -> float:
+        """How long to wait for a stopping proxy (drain.timeout + margin)"""
+        timeout = self.DEFAULT_DRAIN_TIMEOUT
+        try:
+            with open(self.routing_config_file, 'r') as f:
+                config = yaml.safe_load(f) or {}
+            timeout = (config.get('drain') or {}).get('timeout', timeout)
+        except Exception:
+            pass
+        return float(timeout) + self.DRAIN_WAIT_MARGIN
+
     @on(Button.Pressed, "#stop-btn")
     def stop_proxy(self) -> None:
-        """Stop the proxy process"""
-        if self.proxy_process and self.proxy_process.poll() is None:
-            try:
-                self.proxy_process.terminate()
-                self.proxy_process.wait(timeout=5)
-            except subprocess.TimeoutExpired:
-                self.proxy_process.kill()
-            self.proxy_process = None
+        """Stop the proxy process (drains in the background)"""
+        self._stop_proxy(then_start=False)
 
     @on(Button.Pressed, "#restart-btn")
     def restart_proxy(self) -> None:
-        """Restart the proxy process"""
-        self.stop_proxy()
-        self.set_timer(1, self.start_proxy)
+        """Restart the proxy process once the old one has drained"""
+        self._stop_proxy(then_start=True)
+
+    def _stop_proxy(self, then_start: bool) -> None:
+        """Send SIGTERM and wait for exit in a worker thread"""
+        process = self.proxy_process
+        if process and process.poll() is None:
+            process.terminate()
+            self.proxy_process = None
+            self.draining_process = process
+            self.query_one("#status-text", Static).update("⏳ DRAINING")
+            self._wait_for_exit(process, self._drain_wait_seconds(), then_start)
+        else:
+            self.proxy_process = None
+            if then_start:
+                self.start_proxy()
+
+    @work(thread=True, group="proxy-stop")
+    def _wait_for_exit(self, process: subprocess.Popen, timeout: float, then_start: bool) -> None:
+        """Wait for drain to finish, SIGKILL after timeout (worker thread)"""
+        try:
+            process.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+        if then_start:
+            self.call_from_thread(self.start_proxy)
 
     def _refresh_log_file(self) -> None:
         """Refresh log file reference"""
@@ -377,6 +440,103 @@ class ProxyMonitor(App):
         except Exception as e:
             table.add_row("Error", str(e), "")
 
+    @work(thread=True, exclusive=True, group="log-index", exit_on_error=False)
+    def update_log_index(self) -> None:
+        """Index log lines appended since the last update (worker thread)"""
+        try:
+            with self.log_index_lock:
+                self._update_log_index()
+        except Exception as e:
+            self._set_history_status(f"❌ Index error: {e}")
+
+    def _update_log_index(self) -> dict:
+        """Open the index on first use and bring it up to date (lock held)"""
+        if self.log_index is None:
+            self.log_index = LogIndex()
+        return self.log_index.update()
+
+    def _set_history_status(self, text: str) -> None:
+        """Update History tab status line from a worker thread"""
+        self.call_from_thread(self.query_one("#history-status", Static).update, text)
+
+    def _history_filters(self) -> dict:
+        """Read search filters from History tab inputs"""
+        value = lambda widget_id: self.query_one(widget_id, Input).value.strip() or None
+        return {
+            'since': parse_time(value("#history-since")),
+            'until': parse_time(value("#history-until")),
+            'kiosk': value("#history-kiosk"),
+            'op': value("#history-op"),
+            'error': value("#history-error"),
+        }
+
+    def _show_history(self, columns: tuple, rows: list, status: str) -> None:
+        """Fill History table with query results"""
+        table = self.query_one("#history-table", DataTable)
+        table.clear(columns=True)
+        table.add_columns(*columns)
+        table.add_rows(rows)
+        self.query_one("#history-status", Static).update(status)
+
+    @on(Button.Pressed, "#history-search-btn")
+    def search_history(self) -> None:
+        """Show matching log lines from the index"""
+        try:
+            filters = self._history_filters()
+        except ValueError as e:
+            self.query_one("#history-status", Static).update(f"❌ Error: {e}")
+            return
+        self.query_one("#history-status", Static).update("⏳ Searching...")
+        self._search_history(filters)
+
+    @work(thread=True, group="log-search", exit_on_error=False)
+    def _search_history(self, filters: dict) -> None:
+        """Update index and run search (worker thread)"""
+        try:
+            with self.log_index_lock:
+                self._update_log_index()
+                events = self.log_index.search(limit=500, **filters)
+            rows = []
+            for event in events:
+                line = LogIndex.read_line(event['path'], event['offset'])
+                rows.append((
+                    event['ts'], event['level'], event['op'] or "",
+                    event['kiosk'] or "", event['error'] or "",
+                    "(file removed)" if line is None else line[-120:]
+                ))
+            self.call_from_thread(
+                self._show_history, ("Time", "Level", "Route", "Kiosk", "Error", "Line"),
+                rows, f"{len(rows)} lines"
+            )
+        except Exception as e:
+            self._set_history_status(f"❌ Error: {e}")
+
+    @on(Button.Pressed, "#history-stats-btn")
+    def history_stats(self) -> None:
+        """Show error counts per hour by route"""
+        try:
+            filters = self._history_filters()
+        except ValueError as e:
+            self.query_one("#history-status", Static).update(f"❌ Error: {e}")
+            return
+        self.query_one("#history-status", Static).update("⏳ Counting...")
+        self._history_stats(filters)
+
+    @work(thread=True, group="log-search", exit_on_error=False)
+    def _history_stats(self, filters: dict) -> None:
+        """Update index and count errors (worker thread)"""
+        try:
+            with self.log_index_lock:
+                self._update_log_index()
+                rows = self.log_index.stats(['hour', 'route'], errors_only=True, **filters)
+            self.call_from_thread(
+                self._show_history, ("Hour", "Route", "Errors"),
+                [(hour, route or "", str(count)) for hour, route, count in rows],
+                f"{len(rows)} groups"
+            )
+        except Exception as e:
+            self._set_history_status(f"❌ Error: {e}")
+
     @on(Button.Pressed, "#save-settings-btn")
     def save_settings(self) -> None:
         """Save settings to .env file"""
@@ -420,12 +580,19 @@ class ProxyMonitor(App):
 
     def on_unmount(self) -> None:
         """Cleanup when app closes"""
-        if self.proxy_process and self.proxy_process.poll() is None:
-            self.proxy_process.terminate()
-            try:
-                self.proxy_process.wait(timeout=3)
-            except subprocess.TimeoutExpired:
-                self.proxy_process.kill()
+        if self.log_index:
+            # Let a running index update finish before closing the connection
+            with self.log_index_lock:
+                self.log_index.close()
+
+        # App is closing - waiting here no longer blocks the UI
+        for process in (self.proxy_process, self.draining_process):
+            if process and process.poll() is None:
+                process.terminate()
+                try:
+                    process.wait(timeout=self._drain_wait_seconds())
+                except subprocess.TimeoutExpired:
+                    process.kill()
 
 
 if __name__ == "__main__":
@@ -6,24 +6,45 @@ Connects local payment gateway to cloud WebSocket server.
 Forwards JSON messages bidirectionally between WS server and local HTTP gateway.
 """
 
+import time
+IMPORT_STARTED = time.perf_counter()  # Startup timing includes imports
+
 import asyncio
 import websockets
 import aiohttp
 import json
 import logging
 import os
+import random
 import sys
 import signal
-import yaml
-import time
+import uuid
+import warnings
+from collections import deque
 from datetime import datetime
-from typing import Optional, Dict, Any
-from dotenv import load_dotenv
+from typing import Optional, Dict, Any, Tuple
 from logging.handlers import RotatingFileHandler
 from aiohttp import web
 
-# Load environment variables
-load_dotenv()
+# Legacy client API (read_limit/write_limit, .messages buffer, .closed):
+# deprecated since websockets 14 but still shipped, see requirements.txt
+with warnings.catch_warnings():
+    warnings.simplefilter('ignore', DeprecationWarning)
+    from websockets.legacy.client import WebSocketClientProtocol, connect as ws_connect
+
+from adaptive_timeout import AdaptiveTimeout
+from capture import TrafficCapture
+from local_transport import UNIX_SCHEME, is_local_url, local_connector, split_unix_url
+from response_cache import ResponseCache, FRESH, STALE
+from startup import load_config_cached, sd_notify
+from ws_compression import AdaptiveClientPerMessageDeflateFactory, new_wire_stats
+
+# yaml, dotenv and diagnostics are imported lazily (config cache, main(),
+# ADMIN_TOKEN) to keep them off the restart path
+IMPORT_FINISHED = time.perf_counter()
+
+# Connect-phase timeouts have their own exception since aiohttp 3.10
+CONNECT_TIMEOUT_ERRORS = (aiohttp.ConnectionTimeoutError,) if hasattr(aiohttp, 'ConnectionTimeoutError') else ()
 
 
 class PaymentGatewayProxy:
@@ -36,27 +57,132 @@ class PaymentGatewayProxy:
         ws_url: str,
         ws_token: str,
         routing_config_path: str = "routing_config.yaml",
-        log_level: str = "INFO"
+        log_level: str = "INFO",
+        standby_url: Optional[str] = None,
+        admin_token: Optional[str] = None
     ):
         self.ws_url = ws_url
         self.ws_token = ws_token
-        self.websocket: Optional[websockets.WebSocketClientProtocol] = None
+        self.websocket: Optional[WebSocketClientProtocol] = None
         self.running = True
         self.start_time = time.time()
 
+        # Startup phase timings (ms) for the report logged once ready
+        init_started = time.perf_counter()
+        self.startup_phases: Dict[str, float] = {
+            'imports': round((IMPORT_FINISHED - IMPORT_STARTED) * 1000, 1)
+        }
+
         # HTTP session for gateway requests (reusable, with connection pooling)
         self.http_session: Optional[aiohttp.ClientSession] = None
 
+        # Separate keep-alive pools for gateways on this machine, keyed by
+        # unix socket path or 'loopback'; gateway URL -> (pool key, request URL)
+        self.local_sessions: Dict[str, aiohttp.ClientSession] = {}
+        self.gateway_targets: Dict[str, Tuple[Optional[str], str]] = {}
+
         # Offline queue for messages when WS is disconnected (max 10)
         self.offline_queue: asyncio.Queue = asyncio.Queue(maxsize=10)
 
         # Load routing configuration
         self.routing_config = self._load_routing_config(routing_config_path)
+        self._record_phase('config', init_started)
 
         # Cache routes for faster lookup (avoid dict.get on each message)
         self.routes = self.routing_config.get('routes', {})
         self.default_route = self.routing_config.get('default')
 
+        # Opt-in response caches for read-only routes ('cache' in route config)
+        self.route_caches: Dict[str, ResponseCache] = {
+            name: ResponseCache(route['cache'])
+            for name, route in self.routes.items()
+            if route.get('cache')
+        }
+        if self.default_route and self.default_route.get('cache'):
+            self.route_caches['default'] = ResponseCache(self.default_route['cache'])
+        # Background refreshes of stale entries, by cache key
+        self.revalidations: Dict[str, asyncio.Task] = {}
+
+        # Connect/read timeouts per gateway URL ('timeouts' section, per-route
+        # 'timeouts' overrides it); route 'timeout' stays the hard ceiling
+        self.timeouts_config = self.routing_config.get('timeouts') or {}
+        self.route_timeouts: Dict[str, AdaptiveTimeout] = {}
+
+        # Transport for local gateways ('local_transport' section): unix://
+        # routes always use it, loopback TCP routes unless loopback: false
+        self.local_config = self.routing_config.get('local_transport') or {}
+
+        # Outbound path (routing_config.yaml 'websocket' section):
+        # responses go through a bounded outbox to a single sender task
+        self.ws_config = self.routing_config.get('websocket') or {}
+        self.outbox: asyncio.Queue = asyncio.Queue(maxsize=self.ws_config.get('outbox_size', 100))
+        self.high_watermark = self.ws_config.get('high_watermark', 64 * 1024)
+        self.low_watermark = self.ws_config.get('low_watermark', 16 * 1024)
+        self.coalesce = self.ws_config.get('coalesce', False)
+        self.coalesce_max_messages = self.ws_config.get('coalesce_max_messages', 20)
+        self.coalesce_max_bytes = self.ws_config.get('coalesce_max_bytes', 256 * 1024)
+        self.outbound_stats = {
+            'frames_sent': 0,
+            'coalesced_messages': 0,
+            'backpressure_waits': 0,
+            'queue_time_ms_avg': 0.0,
+            'queue_time_ms_max': 0.0
+        }
+        # Messages the sender took from the outbox but has not sent, tracked
+        # as unacked or queued offline yet (persisted on shutdown)
+        self.outbound_batch: list = []
+        self.outbound_carry: list = []
+
+        # Connection tuning: compression ('on' = library default deflate,
+        # 'adaptive' = only messages above threshold, 'off') and size limits
+        self.ws_compression = str(self.ws_config.get('compression', 'on')).lower()
+        self.ws_compression_threshold = self.ws_config.get('compression_threshold', 1024)
+        self.ws_compression_level = self.ws_config.get('compression_level')
+        self.ws_max_size = self.ws_config.get('max_size', 2 ** 20)
+        self.ws_max_queue = self.ws_config.get('max_queue', 32)
+        self.ws_read_limit = self.ws_config.get('read_limit', 2 ** 16)
+        self.wire_stats = new_wire_stats()
+
+        # Acknowledged delivery: responses go out as {"seq": N, "data": ...},
+        # server acks cumulatively with {"type": "ack", "seq": N}; unacked
+        # responses are kept (bounded window) and replayed after reconnect.
+        # Sequence numbers restart at 1 in every process: the connect URL
+        # carries &session=<id>, a new id tells the server to reset its ack state
+        self.ack_enabled = self.ws_config.get('ack', False)
+        self.session_id = uuid.uuid4().hex
+        self.ack_window = self.ws_config.get('ack_window', 100)
+        self.unacked: deque = deque()
+        self.ack_event = asyncio.Event()
+        self.ws_ready = asyncio.Event()
+        self.ack_stats = {
+            'last_seq': 0,
+            'acked_seq': 0,
+            'replayed': 0
+        }
+
+        # Warm standby connection, promoted immediately when the active one
+        # fails (WS_STANDBY_URL, or websocket.standby: true for the same server)
+        if standby_url is None and self.ws_config.get('standby', False):
+            standby_url = ws_url
+        self.standby_url = standby_url
+
+        # Admin-only /debug endpoints on the health server (ADMIN_TOKEN)
+        self.admin_token = admin_token
+        self.standby: Optional[WebSocketClientProtocol] = None
+        self.standby_reader: Optional[asyncio.Task] = None
+        self.standby_check_interval = self.ws_config.get('standby_check_interval', 1)
+
+        # Graceful drain on stop ('drain' section): finish in-flight request,
+        # flush responses, persist whatever could not be delivered
+        drain_config = self.routing_config.get('drain') or {}
+        self.drain_timeout = drain_config.get('timeout', 30)
+        self.pending_path = drain_config.get('pending_path', 'pending_responses.jsonl')
+        self.inflight_path = f"{self.pending_path}.inflight"
+        self.stop_event = asyncio.Event()
+        self.drain_deadline: Optional[float] = None
+        self.handling = False
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+
         # Reconnection settings (exponential backoff)
         self.reconnect_delay = 1  # Start with 1 second
         self.reconnect_max_delay = 60  # Max 60 seconds
@@ -88,39 +214,289 @@ class PaymentGatewayProxy:
         )
         self.logger = logging.getLogger(__name__)
 
+        # Responses persisted by the previous run, sent after first connect
+        self.restored = self._load_undelivered()
+        self.restore_task: Optional[asyncio.Task] = None
+
+        # Optional sampled traffic capture (routing_config.yaml 'capture' section)
+        self.capture = TrafficCapture(self.routing_config.get('capture') or {}, self.logger)
+
         # Statistics
         self.stats = {
             'messages_received': 0,
             'messages_sent': 0,
             'errors': 0,
-            'reconnections': 0
+            'reconnections': 0,
+            'failovers': 0
         }
 
+        # Readiness ('startup' section): upstream gateways warmed (keep-alive
+        # connections opened) -> sd_notify READY=1; plus WS connected -> /ready 200
+        startup_config = self.routing_config.get('startup') or {}
+        self.warmup_enabled = startup_config.get('warmup', True)
+        self.warmup_timeout = startup_config.get('warmup_timeout', 3)
+        self.upstream_warmup: Dict[str, Any] = {}
+        self.warmed = False
+        self.ready_notified = False
+        self.ready_logged = False
+
+        self._record_phase('init', init_started, exclude=('config',))
+
+    def _record_phase(self, name: str, started: float, exclude: Tuple[str, ...] = ()):
+        """Store startup phase duration in ms (minus already recorded sub-phases)"""
+        elapsed = (time.perf_counter() - started) * 1000
+        elapsed -= sum(self.startup_phases.get(phase, 0.0) for phase in exclude)
+        self.startup_phases[name] = round(elapsed, 1)
+
+    def _is_ready(self) -> bool:
+        """Ready to take traffic: not stopping, upstreams warmed, WS connected"""
+        return self.running and self.warmed and bool(self.websocket and not self.websocket.closed)
+
+    def _signal_ready(self):
+        """Notify systemd once the local side is up, report cloud status, log startup timing"""
+        if not self.warmed:
+            return
+
+        connected = bool(self.websocket and not self.websocket.closed)
+        status = "STATUS=Connected" if connected else "STATUS=Waiting for cloud server"
+        if self.ready_notified:
+            sd_notify(status)
+        else:
+            # Health server is up and gateways are warmed: systemctl start
+            # returns even while the cloud is unreachable (/ready stays 503)
+            self.ready_notified = True
+            sd_notify(f"READY=1\n{status}")
+
+        if self._is_ready() and not self.ready_logged:
+            self.ready_logged = True
+            self.startup_phases['total'] = round((time.perf_counter() - IMPORT_STARTED) * 1000, 1)
+            report = ", ".join(f"{phase} {ms}ms" for phase, ms in self.startup_phases.items())
+            self.logger.info(f"⏱️ Startup: {report}")
+            self.logger.info("🟢 Proxy ready")
+
+    async def _warm_upstreams(self):
+        """Open pooled connections to every configured gateway before traffic arrives"""
+        started = time.perf_counter()
+        routes = [*self.routes.values(), self.default_route or {}]
+        urls = {route.get('url') for route in routes if route.get('url')}
+
+        async def warm(url: str):
+            # HEAD is side-effect free; any HTTP status means the gateway answers
+            try:
+                session, request_url = await self._gateway_session(url)
+                async with session.head(
+                    request_url,
+                    timeout=aiohttp.ClientTimeout(total=self.warmup_timeout)
+                ) as response:
+                    self.upstream_warmup[url] = response.status
+            except Exception as e:
+                self.upstream_warmup[url] = type(e).__name__
+
+        if self.warmup_enabled and urls:
+            await asyncio.gather(*(warm(url) for url in urls))
+            answered = sum(isinstance(result, int) for result in self.upstream_warmup.values())
+            self.logger.info(f"🔥 Upstreams warmed: {answered}/{len(urls)} answering")
+            for url, result in self.upstream_warmup.items():
+                if not isinstance(result, int):
+                    self.logger.warning(f"⚠️ Gateway not reachable at startup: {url} ({result})")
+
+        self._record_phase('warmup', started)
+        self.warmed = True
+        self._signal_ready()
+
     def _load_routing_config(self, config_path: str) -> Dict[str, Any]:
-        """Load routing configuration from YAML file"""
+        """Load routing configuration from YAML file (parsed copy cached on disk)"""
         try:
-            with open(config_path, 'r') as f:
-                config = yaml.safe_load(f)
-                return config
+            return load_config_cached(config_path)
         except FileNotFoundError:
             raise Exception(f"Routing config file not found: {config_path}")
-        except yaml.YAMLError as e:
+        except ValueError as e:
             raise Exception(f"Invalid YAML in routing config: {e}")
 
+    async def _open_websocket(self, ws_url: str, standby: bool = False) -> WebSocketClientProtocol:
+        """Open and tune a WebSocket connection (raises on failure)"""
+        # Standby connections announce themselves, the server must not route
+        # requests to them until {"type": "promote"} arrives on that socket
+        query = f"?token={self.ws_token}"
+        if self.ack_enabled:
+            query += f"&session={self.session_id}"
+        if standby:
+            query += "&standby=1"
+        websocket = await asyncio.wait_for(
+            ws_connect(
+                f"{ws_url}{query}",
+                ping_interval=20,
+                ping_timeout=10,
+                compression=None,
+                extensions=self._ws_extensions(),
+                max_size=self.ws_max_size,
+                max_queue=self.ws_max_queue,
+                read_limit=self.ws_read_limit,
+                write_limit=self.high_watermark
+            ),
+            timeout=15.0
+        )
+
+        # Tie outbound flow control to the transport write buffer:
+        # send() pauses above high watermark until drained below low
+        transport = getattr(websocket, 'transport', None)
+        if transport is not None:
+            transport.set_write_buffer_limits(
+                high=self.high_watermark,
+                low=self.low_watermark
+            )
+        return websocket
+
+    def _standby_ready(self) -> bool:
+        """Check if a warm standby connection can take over"""
+        return bool(self.standby and not self.standby.closed)
+
+    def _load_undelivered(self) -> list:
+        """
+        Load responses persisted during the last drain
+
+        The pending file is moved to <pending_path>.inflight and only deleted
+        once its messages were handed off (or persisted again on shutdown), so
+        a crash or SIGKILL before that does not lose them. An .inflight file
+        left by such a crash is restored as well.
+        """
+        messages = []
+        try:
+            for path in (self.inflight_path, self.pending_path):
+                if os.path.exists(path):
+                    with open(path, 'r') as f:
+                        messages.extend(line.rstrip('\n') for line in f if line.strip())
+
+            if os.path.exists(self.pending_path):
+                if os.path.exists(self.inflight_path):
+                    tmp_path = f"{self.inflight_path}.tmp"
+                    with open(tmp_path, 'w') as f:
+                        f.write("\n".join(messages) + "\n")
+                    os.replace(tmp_path, self.inflight_path)
+                    os.remove(self.pending_path)
+                else:
+                    os.replace(self.pending_path, self.inflight_path)
+        except Exception as e:
+            self.logger.error(f"❌ Failed to load undelivered responses: {e}")
+            return []
+
+        if messages:
+            self.logger.info(f"📂 Restored {len(messages)} undelivered responses from last run")
+        return messages
+
+    def _discard_inflight(self):
+        """Delete restored responses file once nothing depends on it"""
+        try:
+            os.remove(self.inflight_path)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            self.logger.error(f"❌ Failed to remove {self.inflight_path}: {e}")
+
+    def _persist_undelivered(self):
+        """Save responses not delivered before shutdown, for the next run"""
+        messages = list(self.restored)
+        messages.extend(self.outbound_batch)
+        messages.extend(reversed(self.outbound_carry))
+        self.outbound_batch, self.outbound_carry = [], []
+        while not self.outbox.empty():
+            messages.append(self.outbox.get_nowait()[0])
+        while not self.offline_queue.empty():
+            messages.append(self.offline_queue.get_nowait())
+        for seq, wrapped in self.unacked:
+            # Strip delivery wrapper, the next run numbers them again
+            messages.append(wrapped[len(f'{{"seq":{seq},"data":'):-1])
+
+        if not messages:
+            self._discard_inflight()
+            return
+
+        try:
+            with open(self.pending_path, 'a') as f:
+                f.write("\n".join(messages) + "\n")
+            self.logger.warning(f"💾 Persisted {len(messages)} undelivered responses to {self.pending_path}")
+        except Exception as e:
+            # Keep .inflight - restored responses are still there for the next run
+            self.logger.error(f"❌ Failed to persist {len(messages)} undelivered responses: {e}")
+            return
+
+        # Restored responses not handed off yet are in the pending file now
+        self._discard_inflight()
+
+    async def _restore_undelivered(self):
+        """
+        Deliver responses restored from the last run
+
+        The .inflight copy is deleted only once they are acked (ack mode) or
+        sent (otherwise); until then a crash still finds them on disk.
+        """
+        if self.ack_enabled:
+            # Numbered and replayed like any other response; background task,
+            # not a handler - waiting here cannot block acks
+            while self.restored:
+                await self.outbox.put((self.restored[0], time.perf_counter()))
+                self.restored.pop(0)
+            await self.outbox.join()
+            last_seq = self.ack_stats['last_seq']
+            while self.ack_stats['acked_seq'] < last_seq:
+                self.ack_event.clear()
+                await self.ack_event.wait()
+        else:
+            # Sent directly while connected: the offline queue is too small to
+            # hold them and would drop the rest
+            while self.restored:
+                await self.ws_ready.wait()
+                websocket = self.websocket
+                try:
+                    if websocket is None or websocket.closed:
+                        raise ConnectionError("WS disconnected")
+                    await websocket.send(self.restored[0])
+                except Exception as e:
+                    self.logger.warning(f"⚠️ Restored response not sent, retrying after reconnect: {e}")
+                    await asyncio.sleep(1)
+                    continue
+                self._count_bytes('out', websocket, self.restored.pop(0))
+                self.stats['messages_sent'] += 1
+        self.logger.info("✅ Restored responses delivered")
+        self._discard_inflight()
+
+    def _drain_remaining(self) -> float:
+        """Seconds left until drain deadline"""
+        if self.drain_deadline is None:
+            return self.drain_timeout
+        return max(0.0, self.drain_deadline - time.monotonic())
+
+    async def _sleep_unless_stopped(self, delay: float):
+        """Sleep for delay seconds, wake up early on stop"""
+        try:
+            await asyncio.wait_for(self.stop_event.wait(), timeout=delay)
+        except asyncio.TimeoutError:
+            pass
+
     async def connect_to_server(self) -> bool:
         """Establish WebSocket connection to cloud server"""
+        # Failover: promote warm standby instead of a full handshake
+        if self._standby_ready():
+            # Main receive loop takes over reading from the promoted socket
+            await self._stop_standby_reader()
+            self.websocket, self.standby = self.standby, None
+            # Standby server is the active one now: full reconnects go there,
+            # the keeper opens the new standby to the previously active server
+            self.ws_url, self.standby_url = self.standby_url, self.ws_url
+            try:
+                await self.websocket.send(json.dumps({'type': 'promote'}))
+            except Exception as e:
+                self.logger.error(f"❌ Standby promotion failed: {type(e).__name__}: {e}")
+                return False
+            self.stats['failovers'] += 1
+            self.logger.info("⚡ Promoted standby connection")
+            self.reconnect_delay = 1
+            return True
+
         try:
-            full_url = f"{self.ws_url}?token={self.ws_token}"
             self.logger.info(f"Connecting to WS server: {self.ws_url}")
 
-            self.websocket = await asyncio.wait_for(
-                websockets.connect(
-                    full_url,
-                    ping_interval=20,
-                    ping_timeout=10
-                ),
-                timeout=15.0
-            )
+            self.websocket = await self._open_websocket(self.ws_url)
 
             self.logger.info("✅ Connected to cloud server")
             # Reset reconnect delay on successful connection
@@ -134,6 +510,96 @@ class PaymentGatewayProxy:
             self.logger.error(f"❌ Connection failed: {type(e).__name__}: {e}")
             return False
 
+    async def _standby_keeper(self):
+        """Keep a warm standby connection open, re-establish with jittered backoff"""
+        delay = 1
+        while self.running:
+            if self._standby_ready():
+                # Keepalive pings run inside the connection itself
+                await asyncio.sleep(self.standby_check_interval)
+                continue
+
+            self.standby = None
+            try:
+                self.standby = await self._open_websocket(self.standby_url, standby=True)
+                self.standby_reader = asyncio.create_task(self._read_standby(self.standby))
+                self.logger.info(f"🔥 Standby connection ready: {self.standby_url}")
+                delay = 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Jitter keeps a fleet of kiosks from reconnecting in lockstep
+                wait = delay * random.uniform(0.5, 1.5)
+                self.logger.warning(
+                    f"⚠️ Standby connection failed: {type(e).__name__}: {e}. Retrying in {wait:.1f}s"
+                )
+                await self._sleep_unless_stopped(wait)
+                delay = min(delay * self.reconnect_multiplier, self.reconnect_max_delay)
+
+    async def _read_standby(self, websocket: WebSocketClientProtocol):
+        """
+        Keep reading the standby socket until promotion
+
+        Reading keeps keepalive pongs processed (an unread socket stops reading
+        once max_queue fills and is closed by keepalive). Requests a server sends
+        here despite the standby contract are answered, not left in the buffer.
+        """
+        try:
+            while True:
+                message = await websocket.recv()
+                self.logger.warning("⚠️ Request received on standby connection")
+                self._count_bytes('in', websocket, message)
+                # Shielded: a promotion cancels only the read, not the handling.
+                # Answered on this socket - it belongs to the server that asked
+                await asyncio.shield(self.handle_message(message, reply_to=websocket))
+        except websockets.exceptions.ConnectionClosed:
+            pass
+
+    async def _stop_standby_reader(self):
+        """Stop reading the standby socket (before promotion or at shutdown)"""
+        if self.standby_reader is None:
+            return
+        self.standby_reader.cancel()
+        try:
+            await self.standby_reader
+        except asyncio.CancelledError:
+            pass
+        self.standby_reader = None
+
+    def _ws_extensions(self) -> Optional[list]:
+        """WebSocket extensions offered to the server for configured compression mode"""
+        if self.ws_compression == 'off':
+            return None
+
+        compress_settings = {'memLevel': 5}  # Same as websockets default
+        if self.ws_compression_level is not None:
+            compress_settings['level'] = self.ws_compression_level
+
+        return [
+            AdaptiveClientPerMessageDeflateFactory(
+                threshold=self.ws_compression_threshold if self.ws_compression == 'adaptive' else 0,
+                wire_stats=self.wire_stats,
+                compress_settings=compress_settings
+            )
+        ]
+
+    def _count_bytes(self, direction: str, websocket, message) -> None:
+        """Add a message to logical (and, when not compressed, wire) byte counters"""
+        size = len(message.encode()) if isinstance(message, str) else len(message)
+        self.wire_stats[f'bytes_{direction}'] += size
+        if not websocket.extensions:
+            # No compression negotiated, extension is not counting
+            self.wire_stats[f'bytes_{direction}_wire'] += size
+
+    def _wire_report(self) -> Dict[str, Any]:
+        """Logical vs on-the-wire payload bytes"""
+        stats = dict(self.wire_stats)
+        logical = stats['bytes_out'] + stats['bytes_in']
+        wire = stats['bytes_out_wire'] + stats['bytes_in_wire']
+        stats['compression'] = self.ws_compression
+        stats['savings_pct'] = round((1 - wire / logical) * 100, 1) if logical else 0.0
+        return stats
+
     def _get_gateway_route(self, operation_type: str) -> Optional[Dict[str, Any]]:
         """
         Get gateway route configuration for given operation type
@@ -166,11 +632,84 @@ class PaymentGatewayProxy:
             )
             self.http_session = aiohttp.ClientSession(connector=connector)
 
+    async def _gateway_session(self, gateway_url: str) -> Tuple[aiohttp.ClientSession, str]:
+        """HTTP session and request URL for gateway (local pool for local gateways)"""
+        target = self.gateway_targets.get(gateway_url)
+        if target is None:
+            if gateway_url.startswith(UNIX_SCHEME):
+                socket_path, http_path = split_unix_url(gateway_url)
+                target = (socket_path, f"http://localhost{http_path}")
+            elif self.local_config.get('loopback', True) and is_local_url(gateway_url):
+                target = ('loopback', gateway_url)
+            else:
+                target = (None, gateway_url)
+            self.gateway_targets[gateway_url] = target
+
+        pool, request_url = target
+        if pool is None:
+            await self._ensure_http_session()
+            return self.http_session, request_url
+
+        session = self.local_sessions.get(pool)
+        if session is None or session.closed:
+            socket_path = None if pool == 'loopback' else pool
+            session = aiohttp.ClientSession(connector=local_connector(self.local_config, socket_path))
+            self.local_sessions[pool] = session
+        return session, request_url
+
+    def _gateway_timeout(self, gateway_url: str, gateway_timeout: float, route: Optional[Dict[str, Any]] = None) -> AdaptiveTimeout:
+        """Timeout tracker for the gateway URL"""
+        timeouts = self.route_timeouts.get(gateway_url)
+        if timeouts is None:
+            config = {**self.timeouts_config, **((route or {}).get('timeouts') or {})}
+            timeouts = self.route_timeouts[gateway_url] = AdaptiveTimeout(config, gateway_timeout)
+        return timeouts
+
     async def send_to_gateway(
         self,
         message_data: Dict[str, Any],
         gateway_url: str,
-        gateway_timeout: int
+        gateway_timeout: int,
+        route: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """
+        Forward message to gateway with the route's (adaptive) connect/read timeouts
+
+        Args:
+            message_data: JSON message (without routing headers)
+            gateway_url: Target gateway URL
+            gateway_timeout: Request timeout ceiling in seconds
+            route: Route config (for per-route timeout settings)
+
+        Returns:
+            Response from gateway or error object
+        """
+        timeouts = self._gateway_timeout(gateway_url, gateway_timeout, route)
+        read_timeout = timeouts.read_timeout()
+        client_timeout = aiohttp.ClientTimeout(
+            total=timeouts.ceiling,
+            sock_connect=timeouts.connect,
+            sock_read=read_timeout
+        )
+
+        started = time.perf_counter()
+        response: Optional[Dict[str, Any]] = None
+        try:
+            response = await self._post_to_gateway(message_data, gateway_url, read_timeout, client_timeout)
+            return response
+        finally:
+            latency = time.perf_counter() - started
+            error = response.get('error') if isinstance(response, dict) else None
+            # Only requests that reached the gateway tell anything about its latency
+            if response is not None and error not in ('connect_timeout', 'connection_refused', 'other'):
+                timeouts.observe(latency, timed_out=error == 'timeout')
+
+    async def _post_to_gateway(
+        self,
+        message_data: Dict[str, Any],
+        gateway_url: str,
+        gateway_timeout: float,
+        client_timeout: Optional[aiohttp.ClientTimeout] = None
     ) -> Dict[str, Any]:
         """
         Forward message to local payment gateway via HTTP POST
@@ -178,7 +717,8 @@ class PaymentGatewayProxy:
         Args:
             message_data: JSON message (without routing headers)
             gateway_url: Target gateway URL
-            gateway_timeout: Request timeout in seconds
+            gateway_timeout: Request (read) timeout in seconds
+            client_timeout: Connect/read/total timeouts (default: total=gateway_timeout)
 
         Returns:
             Response from gateway or error object
@@ -187,14 +727,14 @@ class PaymentGatewayProxy:
             self.logger.info(f"➡️  Forwarding to gateway: {gateway_url}")
             self.logger.debug(f"   Payload: {json.dumps(message_data, ensure_ascii=False, indent=2)}")
 
-            # Ensure session exists
-            await self._ensure_http_session()
+            # Ensure session exists (shared pool or local gateway pool)
+            session, request_url = await self._gateway_session(gateway_url)
 
-            async with self.http_session.post(
-                gateway_url,
+            async with session.post(
+                request_url,
                 json=message_data,
                 headers={'Content-Type': 'application/json'},
-                timeout=aiohttp.ClientTimeout(total=gateway_timeout)
+                timeout=client_timeout or aiohttp.ClientTimeout(total=gateway_timeout)
             ) as response:
 
                 if response.status == 200:
@@ -212,13 +752,21 @@ class PaymentGatewayProxy:
                         'message': f"HTTP {response.status}: {error_text}"
                     }
 
+        except CONNECT_TIMEOUT_ERRORS as e:
+            self.logger.error(f"⏱️ Gateway connect timeout: {e}")
+            self.stats['errors'] += 1
+            return {
+                'status': 'error',
+                'error': 'connect_timeout',
+                'message': f'Gateway connect timeout: {str(e)}'
+            }
         except asyncio.TimeoutError:
-            self.logger.error(f"⏱️ Gateway timeout after {gateway_timeout}s")
+            self.logger.error(f"⏱️ Gateway timeout after {gateway_timeout:g}s")
             self.stats['errors'] += 1
             return {
                 'status': 'error',
                 'error': 'timeout',
-                'message': f'Gateway timeout after {gateway_timeout}s'
+                'message': f'Gateway timeout after {gateway_timeout:g}s'
             }
         except aiohttp.ClientConnectorError as e:
             self.logger.error(f"❌ Cannot connect to gateway: {e}")
@@ -237,12 +785,75 @@ class PaymentGatewayProxy:
                 'message': str(e)
             }
 
-    async def handle_message(self, message: str):
-        """Handle incoming message from WS server"""
+    async def _send_cached(
+        self,
+        operation_type: str,
+        route: Dict[str, Any],
+        message_data: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        """Forward message to gateway through the route's response cache, if any"""
+        cache = self.route_caches.get(operation_type if operation_type in self.routes else 'default')
+        if cache is None:
+            return await self.send_to_gateway(message_data, route['url'], route['timeout'], route)
+
+        key = cache.key(route['url'], message_data)
+        response, state = cache.get(key)
+
+        if state == FRESH:
+            self.logger.info(f"💾 Cache hit: {operation_type}")
+            return response
+
+        if state == STALE:
+            # Serve stale now, refresh once in the background
+            self.logger.info(f"💾 Cache hit (stale, revalidating): {operation_type}")
+            if key not in self.revalidations:
+                cache.stats['revalidations'] += 1
+                task = asyncio.create_task(self._revalidate(cache, key, route, message_data))
+                self.revalidations[key] = task
+                task.add_done_callback(lambda _, key=key: self.revalidations.pop(key, None))
+            return response
+
+        response = await self.send_to_gateway(message_data, route['url'], route['timeout'], route)
+        cache.put(key, response)
+        return response
+
+    async def _revalidate(
+        self,
+        cache: ResponseCache,
+        key: str,
+        route: Dict[str, Any],
+        message_data: Dict[str, Any]
+    ):
+        """Refresh a stale cache entry"""
+        response = await self.send_to_gateway(message_data, route['url'], route['timeout'], route)
+        cache.put(key, response)
+
+    async def handle_message(
+        self,
+        message: str,
+        reply_to: Optional[WebSocketClientProtocol] = None
+    ):
+        """
+        Handle incoming message from WS server
+
+        Args:
+            message: Raw frame text
+            reply_to: Socket to answer on directly (request read from the
+                standby connection), None for the active connection's outbound path
+        """
         try:
+            received_at = time.perf_counter()
+
             # Parse JSON from WS server
             data = json.loads(message)
 
+            # Delivery acks are protocol traffic, not requests
+            if self.ack_enabled and data.get('type') == 'ack':
+                # Only the active connection carries numbered responses
+                if reply_to is None:
+                    self._handle_ack(data.get('seq'))
+                return
+
             # Extract routing headers from headers object or top level
             headers = data.get('headers', {})
             kiosk_id = headers.get('header-kiosk-id') or data.get('Header-Kiosk-Id')
@@ -263,7 +874,7 @@ class PaymentGatewayProxy:
                     'message': 'Header-Operation-Type is required'
                 }
                 self.logger.error("❌ Missing Header-Operation-Type")
-                await self._send_or_queue(json.dumps(error_response))
+                await self._respond(json.dumps(error_response), reply_to)
                 return
 
             # Get route for operation type
@@ -276,10 +887,14 @@ class PaymentGatewayProxy:
                     'message': f'No route configured for operation type: {operation_type}'
                 }
                 self.logger.error(f"❌ Route not found for operation type: {operation_type}")
-                await self._send_or_queue(json.dumps(error_response))
+                await self._respond(json.dumps(error_response), reply_to)
                 self.stats['errors'] += 1
                 return
 
+            # Decide before the body is stripped of headers, capture needs the original
+            capture = self.capture.should_sample()
+            envelope = json.loads(message) if capture else None
+
             # Extract body for gateway (if present) or use full data without headers
             message_to_send = data.get('body', data.copy())
 
@@ -289,15 +904,21 @@ class PaymentGatewayProxy:
                 message_to_send.pop('Header-Operation-Type', None)
                 message_to_send.pop('headers', None)
 
-            # Forward to gateway based on route
-            response = await self.send_to_gateway(
-                message_to_send,
-                route['url'],
-                route['timeout']
-            )
+            # Forward to gateway based on route (or answer from cache)
+            gateway_started = time.perf_counter()
+            response = await self._send_cached(operation_type, route, message_to_send)
+            gateway_finished = time.perf_counter()
 
             # Send response back to WS server (as-is)
-            await self._send_or_queue(json.dumps(response))
+            await self._respond(json.dumps(response), reply_to)
+
+            if capture:
+                finished = time.perf_counter()
+                self.capture.record(envelope, message_to_send, response, operation_type, {
+                    'gateway': round((gateway_finished - gateway_started) * 1000, 3),
+                    'send': round((finished - gateway_finished) * 1000, 3),
+                    'total': round((finished - received_at) * 1000, 3)
+                })
 
             self.logger.info(f"📤 Sent response: {response.get('status', 'unknown')}")
             self.logger.debug(f"Full response: {json.dumps(response, ensure_ascii=False, indent=2)}")
@@ -311,7 +932,7 @@ class PaymentGatewayProxy:
                 'error': 'invalid_json',
                 'message': f'Failed to parse JSON: {str(e)}'
             }
-            await self._send_or_queue(json.dumps(error_response))
+            await self._respond(json.dumps(error_response), reply_to)
 
         except Exception as e:
             self.logger.error(f"❌ Error handling message: {type(e).__name__}: {e}")
@@ -322,19 +943,46 @@ class PaymentGatewayProxy:
                 'error': 'processing_error',
                 'message': f'Failed to process message: {str(e)}'
             }
-            await self._send_or_queue(json.dumps(error_response))
+            await self._respond(json.dumps(error_response), reply_to)
+
+    async def _respond(
+        self,
+        message: str,
+        reply_to: Optional[WebSocketClientProtocol] = None
+    ):
+        """Send response through the outbound path, or on the socket the request came from"""
+        if reply_to is None:
+            await self._send_or_queue(message)
+            return
+        # Outside outbox and acknowledged delivery: that server is not the active one
+        try:
+            await reply_to.send(message)
+            self._count_bytes('out', reply_to, message)
+            self.stats['messages_sent'] += 1
+        except Exception as e:
+            self.logger.error(f"❌ Failed to answer on standby connection: {type(e).__name__}: {e}")
+            self.stats['errors'] += 1
 
     async def _send_or_queue(self, message: str):
-        """Send message to WS server or queue if disconnected"""
-        if self.websocket and not self.websocket.closed:
+        """Hand message to outbound sender or queue if disconnected"""
+        if self.ack_enabled:
+            # Sender may be waiting for acks, which arrive through the receive
+            # loop this handler runs in - so never wait here
             try:
-                await self.websocket.send(message)
-                self.stats['messages_sent'] += 1
+                self.outbox.put_nowait((message, time.perf_counter()))
                 return True
-            except Exception as e:
-                self.logger.error(f"❌ Failed to send: {e}")
+            except asyncio.QueueFull:
+                return self._queue_offline(message)
+
+        if self.websocket and not self.websocket.closed:
+            # Waits only when the outbox is full (backpressure to the receive loop)
+            await self.outbox.put((message, time.perf_counter()))
+            return True
 
-        # WS disconnected or send failed - try to queue
+        return self._queue_offline(message)
+
+    def _queue_offline(self, message: str) -> bool:
+        """Put message into offline queue, drop if full"""
         try:
             self.offline_queue.put_nowait(message)
             queue_size = self.offline_queue.qsize()
@@ -345,6 +993,126 @@ class PaymentGatewayProxy:
             self.stats['errors'] += 1
             return False
 
+    def _next_outbound_batch(self, first: str, carry: list) -> list:
+        """Collect already queued messages to coalesce with first (never waits)"""
+        batch = [first]
+        size = len(first)
+        while (
+            len(batch) < self.coalesce_max_messages
+            and not self.outbox.empty()
+        ):
+            message, enqueued_at = self.outbox.get_nowait()
+            self._record_queue_time(enqueued_at)
+            if size + len(message) > self.coalesce_max_bytes:
+                # Does not fit - becomes first message of the next frame
+                carry.append(message)
+                break
+            batch.append(message)
+            size += len(message)
+        return batch
+
+    def _record_queue_time(self, enqueued_at: float):
+        """Update outbound queue time metrics"""
+        queue_time_ms = (time.perf_counter() - enqueued_at) * 1000
+        stats = self.outbound_stats
+        # Exponential moving average, recent traffic matters most
+        stats['queue_time_ms_avg'] = round(stats['queue_time_ms_avg'] * 0.9 + queue_time_ms * 0.1, 3)
+        stats['queue_time_ms_max'] = round(max(stats['queue_time_ms_max'], queue_time_ms), 3)
+
+    async def _outbound_sender(self):
+        """Send outbox messages to WS server, one frame at a time"""
+        carry = self.outbound_carry
+        while True:
+            if carry:
+                first = carry.pop()
+            else:
+                first, enqueued_at = await self.outbox.get()
+                self._record_queue_time(enqueued_at)
+
+            batch = self._next_outbound_batch(first, carry) if self.coalesce else [first]
+            # Until sent or handed to unacked/offline queue, shutdown persists it from here
+            self.outbound_batch = batch
+
+            if self.ack_enabled:
+                # Number responses and keep them until acked; sending resumes
+                # only after the unacked window was replayed on reconnect
+                await self._wait_for_ack_window(len(batch))
+                batch = [self._track_unacked(message) for message in batch]
+                self.outbound_batch = []
+
+            try:
+                websocket = self.websocket
+                if websocket is None or websocket.closed:
+                    raise ConnectionError("WS disconnected")
+
+                transport = getattr(websocket, 'transport', None)
+                if transport is not None and transport.get_write_buffer_size() >= self.high_watermark:
+                    self.outbound_stats['backpressure_waits'] += 1
+
+                # Coalesced frame is a JSON array of responses
+                frame = batch[0] if len(batch) == 1 else f"[{','.join(batch)}]"
+                await websocket.send(frame)
+                self._count_bytes('out', websocket, frame)
+
+                self.outbound_batch = []
+                self.stats['messages_sent'] += len(batch)
+                self.outbound_stats['frames_sent'] += 1
+                if len(batch) > 1:
+                    self.outbound_stats['coalesced_messages'] += len(batch)
+            except Exception as e:
+                self.logger.error(f"❌ Failed to send: {e}")
+                if self.ack_enabled:
+                    self.logger.warning(f"📦 {len(batch)} unacked message(s) kept for replay")
+                else:
+                    for message in batch:
+                        self._queue_offline(message)
+                self.outbound_batch = []
+            finally:
+                for _ in batch:
+                    self.outbox.task_done()
+
+    async def _wait_for_ack_window(self, count: int):
+        """Wait until connected and the unacked window has room for count messages"""
+        while True:
+            await self.ws_ready.wait()
+            if not self.unacked or len(self.unacked) + count <= self.ack_window:
+                return
+            self.ack_event.clear()
+            await self.ack_event.wait()
+
+    def _track_unacked(self, message: str) -> str:
+        """Wrap message with next sequence number and remember it until acked"""
+        self.ack_stats['last_seq'] += 1
+        seq = self.ack_stats['last_seq']
+        wrapped = f'{{"seq":{seq},"data":{message}}}'
+        self.unacked.append((seq, wrapped))
+        return wrapped
+
+    def _handle_ack(self, seq: Any):
+        """Release responses acknowledged by server (cumulative ack)"""
+        if not isinstance(seq, int):
+            self.logger.warning(f"⚠️ Invalid ack: {seq}")
+            return
+        while self.unacked and self.unacked[0][0] <= seq:
+            self.unacked.popleft()
+        self.ack_stats['acked_seq'] = max(self.ack_stats['acked_seq'], seq)
+        self.ack_event.set()
+
+    async def _replay_unacked(self):
+        """Resend responses not acknowledged before the connection dropped"""
+        if not self.unacked:
+            return
+
+        self.logger.info(f"🔁 Replaying {len(self.unacked)} unacked messages...")
+        for seq, message in list(self.unacked):
+            try:
+                await self.websocket.send(message)
+                self._count_bytes('out', self.websocket, message)
+                self.ack_stats['replayed'] += 1
+            except Exception as e:
+                self.logger.error(f"❌ Failed to replay message {seq}: {e}")
+                break
+
     async def _flush_queue(self):
         """Flush offline queue after reconnection"""
         if self.offline_queue.empty():
@@ -353,10 +1121,17 @@ class PaymentGatewayProxy:
         initial_size = self.offline_queue.qsize()
         self.logger.info(f"📤 Flushing {initial_size} queued messages...")
 
+        if self.ack_enabled:
+            # Let the sender number them like any other response
+            while not self.offline_queue.empty() and not self.outbox.full():
+                self.outbox.put_nowait((self.offline_queue.get_nowait(), time.perf_counter()))
+            return
+
         while not self.offline_queue.empty():
             try:
                 queued_msg = self.offline_queue.get_nowait()
                 await self.websocket.send(queued_msg)
+                self._count_bytes('out', self.websocket, queued_msg)
                 self.stats['messages_sent'] += 1
                 remaining = self.offline_queue.qsize()
                 self.logger.info(f"✅ Sent queued message ({remaining} remaining)")
@@ -371,19 +1146,63 @@ class PaymentGatewayProxy:
 
     async def receive_messages(self):
         """Receive and process messages from WS server"""
-        # First, flush any queued messages from previous disconnect
+        # First, replay unacked and flush queued messages from previous disconnect
+        await self._replay_unacked()
         await self._flush_queue()
+        self.ws_ready.set()
+
+        if self.restored and self.restore_task is None:
+            self.restore_task = asyncio.create_task(self._restore_undelivered())
 
         try:
             async for message in self.websocket:
                 if not self.running:
                     break
-                await self.handle_message(message)
+                self._count_bytes('in', self.websocket, message)
+
+                self.handling = True
+                try:
+                    await self.handle_message(message)
+                finally:
+                    self.handling = False
+
+                # Draining - do not take the next frame
+                if not self.running:
+                    break
 
         except websockets.exceptions.ConnectionClosed:
             self.logger.warning("⚠️  WebSocket connection closed")
         except Exception as e:
             self.logger.error(f"❌ Error receiving messages: {e}")
+        finally:
+            # Leaving for a drain keeps the sender going on the open socket
+            if self.running or self.websocket is None or self.websocket.closed:
+                self.ws_ready.clear()
+
+    async def _receive_until_stopped(self):
+        """Receive messages until connection is lost or proxy is stopped (drain)"""
+        receive_task = asyncio.create_task(self.receive_messages())
+        stop_wait = asyncio.create_task(self.stop_event.wait())
+        try:
+            await asyncio.wait({receive_task, stop_wait}, return_when=asyncio.FIRST_COMPLETED)
+            if receive_task.done():
+                return
+
+            # Stopped: no new frames are taken, in-flight request may finish
+            if self.handling:
+                self.logger.info(f"⏳ Draining: waiting up to {self._drain_remaining():.0f}s for in-flight request...")
+                await asyncio.wait({receive_task}, timeout=self._drain_remaining())
+
+            if not receive_task.done():
+                if self.handling:
+                    self.logger.error("❌ Drain deadline exceeded, in-flight request cancelled")
+                receive_task.cancel()
+            try:
+                await receive_task
+            except asyncio.CancelledError:
+                pass
+        finally:
+            stop_wait.cancel()
 
     def print_stats(self, periodic: bool = False):
         """Print statistics"""
@@ -394,6 +1213,11 @@ class PaymentGatewayProxy:
         self.logger.info(f"   Messages sent: {self.stats['messages_sent']}")
         self.logger.info(f"   Errors: {self.stats['errors']}")
         self.logger.info(f"   Reconnections: {self.stats['reconnections']}")
+        wire = self._wire_report()
+        self.logger.info(
+            f"   WS bytes out/in: {wire['bytes_out']}/{wire['bytes_in']} "
+            f"(wire {wire['bytes_out_wire']}/{wire['bytes_in_wire']}, saved {wire['savings_pct']}%)"
+        )
         self.logger.info("=" * 60)
 
     async def _periodic_stats(self):
@@ -410,17 +1234,47 @@ class PaymentGatewayProxy:
 
         return web.json_response({
             'status': status,
+            'ready': self._is_ready(),
             'ws_connected': ws_connected,
+            'draining': not self.running,
+            'standby_connected': self._standby_ready(),
             'uptime_seconds': round(time.time() - self.start_time, 2),
             'stats': self.stats,
             'queue_size': self.offline_queue.qsize(),
-            'routes_configured': len(self.routes)
+            'outbound': {**self.outbound_stats, 'outbox_size': self.outbox.qsize()},
+            'wire': self._wire_report(),
+            'ack': {
+                **self.ack_stats, 'session': self.session_id, 'unacked': len(self.unacked)
+            } if self.ack_enabled else None,
+            'routes_configured': len(self.routes),
+            'cache': {name: cache.report() for name, cache in self.route_caches.items()} or None,
+            'timeouts': {
+                url: timeouts.report() for url, timeouts in self.route_timeouts.items()
+                if timeouts.adaptive or timeouts.connect
+            } or None,
+            'capture': self.capture.stats if self.capture.enabled else None,
+            'startup_ms': self.startup_phases
         })
 
+    async def _ready_handler(self, request):
+        """Readiness endpoint: 200 once WS is connected and upstreams are warmed, else 503"""
+        ready = self._is_ready()
+        return web.json_response({
+            'ready': ready,
+            'ws_connected': bool(self.websocket and not self.websocket.closed),
+            'warmed': self.warmed,
+            'upstreams': self.upstream_warmup,
+            'startup_ms': self.startup_phases
+        }, status=200 if ready else 503)
+
     async def _start_health_server(self):
         """Start HTTP health check server on localhost:9090"""
         app = web.Application()
         app.router.add_get('/health', self._health_handler)
+        app.router.add_get('/ready', self._ready_handler)
+        if self.admin_token:
+            from diagnostics import Diagnostics
+            Diagnostics(self.admin_token, self.logger).register(app)
 
         runner = web.AppRunner(app)
         await runner.setup()
@@ -428,33 +1282,61 @@ class PaymentGatewayProxy:
         await site.start()
 
         self.logger.info("🏥 Health check server started on http://localhost:9090/health")
+        if self.admin_token:
+            self.logger.info("🔬 Diagnostics enabled on http://localhost:9090/debug/")
         return runner
 
     async def run(self):
         """Main run loop with automatic reconnection and exponential backoff"""
+        self.loop = asyncio.get_running_loop()
         self.logger.info("🚀 Payment Gateway Proxy starting...")
         self.logger.info(f"   WS Server: {self.ws_url}")
         self.logger.info(f"   Routing config loaded with {len(self.routes)} routes")
 
+        run_started = time.perf_counter()
+        sd_notify("STATUS=Starting")
+
         # Start health check server
         health_runner = await self._start_health_server()
+        self._record_phase('health_server', run_started)
+
+        # Warm gateway connections while the WS connects
+        warmup_task = asyncio.create_task(self._warm_upstreams())
 
         # Start periodic statistics task
         stats_task = asyncio.create_task(self._periodic_stats())
 
+        # Start outbound sender task
+        sender_task = asyncio.create_task(self._outbound_sender())
+
+        # Keep warm standby connection (optional)
+        standby_task = asyncio.create_task(self._standby_keeper()) if self.standby_url else None
+
+        # Start traffic capture writer (no-op when disabled)
+        self.capture.start()
+
         while self.running:
             try:
                 if await self.connect_to_server():
-                    # Connection successful, start receiving messages
-                    await self.receive_messages()
+                    if 'ws_connect' not in self.startup_phases:
+                        self._record_phase('ws_connect', run_started, exclude=('health_server',))
+                    self._signal_ready()
 
-                    # Connection lost, will reconnect
+                    # Connection successful, start receiving messages
+                    await self._receive_until_stopped()
                     if self.running:
+                        sd_notify("STATUS=Reconnecting to cloud server")
+
+                    # Connection lost, fail over right away if standby is warm
+                    if self.running and self._standby_ready():
+                        self.stats['reconnections'] += 1
+                        self.logger.warning("⚠️  Connection lost. Failing over to standby...")
+                    elif self.running:
                         self.stats['reconnections'] += 1
                         self.logger.warning(
                             f"⚠️  Connection lost. Reconnecting in {self.reconnect_delay}s..."
                         )
-                        await asyncio.sleep(self.reconnect_delay)
+                        await self._sleep_unless_stopped(self.reconnect_delay)
 
                         # Exponential backoff
                         self.reconnect_delay = min(
@@ -464,10 +1346,12 @@ class PaymentGatewayProxy:
                 else:
                     # Connection failed
                     if self.running:
+                        if self.ready_notified:
+                            sd_notify(f"STATUS=Cloud server unreachable, retrying in {self.reconnect_delay}s")
                         self.logger.error(
                             f"❌ Connection failed. Retrying in {self.reconnect_delay}s..."
                         )
-                        await asyncio.sleep(self.reconnect_delay)
+                        await self._sleep_unless_stopped(self.reconnect_delay)
 
                         # Exponential backoff
                         self.reconnect_delay = min(
@@ -482,7 +1366,67 @@ class PaymentGatewayProxy:
             except Exception as e:
                 self.logger.error(f"❌ Unexpected error: {e}")
                 if self.running:
-                    await asyncio.sleep(self.reconnect_delay)
+                    await self._sleep_unless_stopped(self.reconnect_delay)
+
+        # Drain: deliver outbox (and get it acked) while the socket is still open
+        if self.websocket and not self.websocket.closed:
+            try:
+                # join() also covers messages the sender already took out
+                await asyncio.wait_for(self.outbox.join(), timeout=self._drain_remaining())
+                if self.ack_enabled and self.unacked:
+                    # Acks still arrive only through the receive loop, which is
+                    # stopped - read them here
+                    await asyncio.wait_for(self._receive_acks(), timeout=self._drain_remaining())
+            except asyncio.TimeoutError:
+                self.logger.warning(
+                    f"⚠️ Drain deadline exceeded: {self.outbox.qsize()} queued, "
+                    f"{len(self.unacked)} unacked messages left"
+                )
+            except websockets.exceptions.ConnectionClosed:
+                self.logger.warning(
+                    f"⚠️ WebSocket closed during drain: {self.outbox.qsize()} queued, "
+                    f"{len(self.unacked)} unacked messages left"
+                )
+            except Exception as e:
+                self.logger.error(f"❌ Drain failed: {type(e).__name__}: {e}")
+
+        # Cancel outbound sender task
+        sender_task.cancel()
+        try:
+            await sender_task
+        except asyncio.CancelledError:
+            pass
+
+        if self.restore_task:
+            self.restore_task.cancel()
+            try:
+                await self.restore_task
+            except asyncio.CancelledError:
+                pass
+
+        # Keep undelivered responses for the next run
+        self._persist_undelivered()
+
+        if not warmup_task.done():
+            warmup_task.cancel()
+            try:
+                await warmup_task
+            except asyncio.CancelledError:
+                pass
+
+        # Stop standby keeper
+        if standby_task:
+            standby_task.cancel()
+            try:
+                await standby_task
+            except asyncio.CancelledError:
+                pass
+
+        # Stale cache refreshes are not worth waiting for on shutdown
+        revalidations = list(self.revalidations.values())
+        for task in revalidations:
+            task.cancel()
+        await asyncio.gather(*revalidations, return_exceptions=True)
 
         # Cancel periodic stats task
         stats_task.cancel()
@@ -491,6 +1435,9 @@ class PaymentGatewayProxy:
         except asyncio.CancelledError:
             pass
 
+        # Write out remaining captured traffic
+        await self.capture.stop()
+
         # Stop health check server
         try:
             await health_runner.cleanup()
@@ -505,6 +1452,13 @@ class PaymentGatewayProxy:
             except Exception as e:
                 self.logger.error(f"Error closing websocket: {e}")
 
+        await self._stop_standby_reader()
+        if self.standby and not self.standby.closed:
+            try:
+                await self.standby.close()
+            except Exception as e:
+                self.logger.error(f"Error closing standby websocket: {e}")
+
         # Close HTTP session
         if self.http_session and not self.http_session.closed:
             try:
@@ -512,22 +1466,82 @@ class PaymentGatewayProxy:
             except Exception as e:
                 self.logger.error(f"Error closing HTTP session: {e}")
 
+        for session in self.local_sessions.values():
+            if not session.closed:
+                try:
+                    await session.close()
+                except Exception as e:
+                    self.logger.error(f"Error closing local HTTP session: {e}")
+
         self.print_stats(periodic=False)
         self.logger.info("👋 Payment Gateway Proxy stopped")
 
+    @staticmethod
+    def _is_ack_frame(message: Any) -> bool:
+        """Check if a raw WS frame is a delivery ack"""
+        try:
+            data = json.loads(message)
+        except (TypeError, ValueError):
+            return False
+        return isinstance(data, dict) and data.get('type') == 'ack'
+
+    async def _receive_acks(self):
+        """
+        Read delivery acks until everything is acked (drain)
+
+        Frames are only taken from the receive buffer when they are acks: a
+        request arriving during the drain stays unread (and unanswered) instead
+        of being consumed and dropped, so waiting for acks stops there.
+        """
+        websocket = self.websocket
+        # Receive buffer of the legacy protocol - peeked, not popped
+        buffered = websocket.messages
+        while self.unacked:
+            if not buffered:
+                if websocket.closed:
+                    # Nothing buffered on a closed socket: raises ConnectionClosed
+                    await websocket.recv()
+                await asyncio.sleep(0.01)
+                continue
+            if not self._is_ack_frame(buffered[0]):
+                self.logger.warning(
+                    f"⚠️ Request arrived during drain, left unread; "
+                    f"{len(self.unacked)} unacked messages left"
+                )
+                return
+            message = await websocket.recv()
+            self._count_bytes('in', websocket, message)
+            data = json.loads(message)
+            self._handle_ack(data.get('seq'))
+
     def stop(self):
-        """Stop the proxy gracefully"""
-        self.logger.info("🛑 Stopping proxy...")
+        """Stop the proxy gracefully (drain in-flight requests, then exit)"""
+        if not self.running:
+            return
+        self.logger.info(f"🛑 Stopping proxy (draining, up to {self.drain_timeout}s)...")
         self.running = False
+        sd_notify("STOPPING=1")
+        self.drain_deadline = time.monotonic() + self.drain_timeout
+        # May be called from a signal handler - wake the event loop safely
+        if self.loop and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self.stop_event.set)
+        else:
+            self.stop_event.set()
 
 
 def main():
     """Main entry point"""
+    # Load environment variables (.env)
+    from dotenv import load_dotenv
+    load_dotenv()
+
     # Load configuration from environment
     ws_url = os.getenv('WS_SERVER_URL')
     ws_token = os.getenv('WS_TOKEN')
     routing_config_path = os.getenv('ROUTING_CONFIG_PATH', 'routing_config.yaml')
     log_level = os.getenv('LOG_LEVEL', 'INFO')
+    standby_url = os.getenv('WS_STANDBY_URL')  # Optional warm standby server
+    admin_token = os.getenv('ADMIN_TOKEN')  # Optional /debug endpoints
 
     # Validate required configuration
     if not all([ws_url, ws_token]):
@@ -544,7 +1558,9 @@ def main():
         ws_url=ws_url,
         ws_token=ws_token,
         routing_config_path=routing_config_path,
-        log_level=log_level
+        log_level=log_level,
+        standby_url=standby_url,
+        admin_token=admin_token
     )
 
     # Handle shutdown signals
@@ -0,0 +1,114 @@
+"""
+Response Cache for Payment Gateway Proxy
+
+Opt-in per-route TTL cache for read-only operation types. Entries are keyed
+on a canonical hash of gateway URL and routed body, evicted LRU when the
+route's byte budget is exceeded, and may be served stale for a grace period
+while the proxy refreshes them in the background (stale-while-revalidate).
+"""
+
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+
+FRESH = 'fresh'
+STALE = 'stale'
+
+
+class ResponseCache:
+    """
+    Byte-bounded LRU cache with TTL and stale-while-revalidate.
+    """
+
+    def __init__(self, config: Dict[str, Any]):
+        self.ttl = float(config.get('ttl', 30))
+        self.stale_while_revalidate = float(config.get('stale_while_revalidate', 0))
+        self.max_bytes = int(config.get('max_bytes', 1024 * 1024))
+
+        # key -> (response, size, stored_at); order = recency
+        self.entries: OrderedDict = OrderedDict()
+        self.bytes = 0
+
+        self.stats = {
+            'hits': 0,
+            'stale_hits': 0,
+            'misses': 0,
+            'stores': 0,
+            'evictions': 0,
+            'revalidations': 0
+        }
+
+    @staticmethod
+    def key(url: str, body: Any) -> str:
+        """Canonical hash of request: same JSON in any key order -> same key"""
+        canonical = json.dumps(body, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+        return hashlib.sha256(f"{url}\n{canonical}".encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Tuple[Any, Optional[str]]:
+        """
+        Look up cached response
+
+        Returns:
+            (response, FRESH or STALE), or (None, None) on miss
+        """
+        entry = self.entries.get(key)
+        if entry is None:
+            self.stats['misses'] += 1
+            return None, None
+
+        response, size, stored_at = entry
+        age = time.monotonic() - stored_at
+
+        if age <= self.ttl:
+            self.entries.move_to_end(key)
+            self.stats['hits'] += 1
+            return response, FRESH
+
+        if age <= self.ttl + self.stale_while_revalidate:
+            self.entries.move_to_end(key)
+            self.stats['stale_hits'] += 1
+            return response, STALE
+
+        # Too old to serve
+        self._remove(key)
+        self.stats['misses'] += 1
+        return None, None
+
+    def put(self, key: str, response: Any):
+        """Store response unless it is an error or larger than the whole budget"""
+        if isinstance(response, dict) and response.get('status') == 'error':
+            return
+
+        size = len(json.dumps(response, separators=(',', ':'), default=str))
+        if size > self.max_bytes:
+            return
+
+        if key in self.entries:
+            self._remove(key)
+
+        self.entries[key] = (response, size, time.monotonic())
+        self.bytes += size
+        self.stats['stores'] += 1
+
+        while self.bytes > self.max_bytes:
+            oldest = next(iter(self.entries))
+            self._remove(oldest)
+            self.stats['evictions'] += 1
+
+    def _remove(self, key: str):
+        _, size, _ = self.entries.pop(key)
+        self.bytes -= size
+
+    def report(self) -> Dict[str, Any]:
+        """Stats for /health"""
+        lookups = self.stats['hits'] + self.stats['stale_hits'] + self.stats['misses']
+        hits = self.stats['hits'] + self.stats['stale_hits']
+        return {
+            **self.stats,
+            'entries': len(self.entries),
+            'bytes': self.bytes,
+            'hit_ratio': round(hits / lookups, 3) if lookups else 0.0
+        }
@@ -0,0 +1,83 @@
+"""
+Startup Helpers for Payment Gateway Proxy
+
+- Routing config cache: the parsed YAML is kept as JSON next to the config
+  and reused while the YAML file is unchanged (same mtime and size), so a
+  restart neither imports PyYAML nor parses the file.
+- sd_notify: readiness/status messages to systemd (Type=notify) over
+  $NOTIFY_SOCKET, without the python-systemd dependency.
+"""
+
+import json
+import os
+import socket
+from pathlib import Path
+from typing import Any, Dict
+
+
+def _cache_path(config_path: Path) -> Path:
+    return config_path.with_name(f".{config_path.name}.cache.json")
+
+
+def load_config_cached(config_path: str) -> Dict[str, Any]:
+    """
+    Load YAML config, from the parsed-config cache when it is current
+
+    Raises:
+        FileNotFoundError: config file missing
+        ValueError: invalid YAML
+    """
+    path = Path(config_path)
+    stat = path.stat()
+    cache_path = _cache_path(path)
+    signature = {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size}
+
+    try:
+        with open(cache_path, 'r') as f:
+            cached = json.load(f)
+        if cached.get('signature') == signature:
+            return cached['config']
+    except (OSError, ValueError, AttributeError, KeyError):
+        pass
+
+    # Cache miss: parse YAML (imported only here)
+    import yaml
+    try:
+        with open(path, 'r') as f:
+            config = yaml.safe_load(f)
+    except yaml.YAMLError as e:
+        raise ValueError(str(e))
+
+    try:
+        # Only cache what survives the JSON round trip unchanged
+        payload = json.dumps({'signature': signature, 'config': config})
+        if json.loads(payload)['config'] == config:
+            tmp_path = cache_path.with_suffix('.tmp')
+            tmp_path.write_text(payload)
+            os.replace(tmp_path, cache_path)
+    except (OSError, TypeError, ValueError):
+        pass
+
+    return config
+
+
+def sd_notify(message: str) -> bool:
+    """
+    Send a notification to systemd (e.g. "READY=1", "STATUS=...")
+
+    Returns:
+        True if sent, False when not running under systemd Type=notify
+    """
+    address = os.environ.get('NOTIFY_SOCKET')
+    if not address:
+        return False
+    if address.startswith('@'):
+        # Abstract namespace socket
+        address = '\0' + address[1:]
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+            sock.connect(address)
+            sock.sendall(message.encode('utf-8'))
+        return True
+    except OSError:
+        return False
@@ -0,0 +1,88 @@
+"""
+WebSocket Compression for Payment Gateway Proxy
+
+permessage-deflate extension that can skip compression for small messages
+(RFC 7692 allows uncompressed messages on a deflate connection - the RSV1
+bit is set per message) and counts payload bytes on the wire, so savings
+can be compared with logical message sizes.
+"""
+
+from typing import Any, Dict, Optional, Sequence
+
+from websockets import frames
+from websockets.extensions.permessage_deflate import (
+    ClientPerMessageDeflateFactory,
+    PerMessageDeflate,
+)
+
+
+def new_wire_stats() -> Dict[str, int]:
+    """Counters shared between the proxy and the extension"""
+    return {
+        'bytes_out': 0,
+        'bytes_out_wire': 0,
+        'bytes_in': 0,
+        'bytes_in_wire': 0,
+        'messages_compressed': 0,
+        'messages_uncompressed': 0
+    }
+
+
+class AdaptivePerMessageDeflate(PerMessageDeflate):
+    """
+    Per-Message Deflate that sends messages below threshold uncompressed.
+    """
+
+    def __init__(self, *args, threshold: int = 0, wire_stats: Optional[Dict[str, int]] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.threshold = threshold
+        self.wire_stats = wire_stats if wire_stats is not None else new_wire_stats()
+
+    def encode(self, frame: frames.Frame) -> frames.Frame:
+        if frame.opcode in frames.CTRL_OPCODES:
+            return frame
+
+        # Only whole (single-frame) messages may skip compression; a skipped
+        # message never touches the compressor, so its context stays valid
+        if frame.opcode is not frames.Opcode.CONT and frame.fin and len(frame.data) < self.threshold:
+            self.wire_stats['messages_uncompressed'] += 1
+            self.wire_stats['bytes_out_wire'] += len(frame.data)
+            return frame
+
+        encoded = super().encode(frame)
+        if frame.opcode is not frames.Opcode.CONT:
+            self.wire_stats['messages_compressed'] += 1
+        self.wire_stats['bytes_out_wire'] += len(encoded.data)
+        return encoded
+
+    def decode(self, frame: frames.Frame, *, max_size: Optional[int] = None) -> frames.Frame:
+        if frame.opcode not in frames.CTRL_OPCODES:
+            self.wire_stats['bytes_in_wire'] += len(frame.data)
+        return super().decode(frame, max_size=max_size)
+
+
+class AdaptiveClientPerMessageDeflateFactory(ClientPerMessageDeflateFactory):
+    """
+    Client factory negotiating permessage-deflate with AdaptivePerMessageDeflate.
+    """
+
+    def __init__(self, threshold: int = 0, wire_stats: Optional[Dict[str, int]] = None, **kwargs):
+        super().__init__(**kwargs)
+        self.threshold = threshold
+        self.wire_stats = wire_stats
+
+    def process_response_params(
+        self,
+        params: Sequence[Any],
+        accepted_extensions: Sequence[Any],
+    ) -> AdaptivePerMessageDeflate:
+        extension = super().process_response_params(params, accepted_extensions)
+        return AdaptivePerMessageDeflate(
+            extension.remote_no_context_takeover,
+            extension.local_no_context_takeover,
+            extension.remote_max_window_bits,
+            extension.local_max_window_bits,
+            extension.compress_settings,
+            threshold=self.threshold,
+            wire_stats=self.wire_stats
+        )